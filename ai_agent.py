@@ -1,51 +1,567 @@
-# if you dont use pipenv uncomment the following:
-# from dotenv import load_dotenv
-# load_dotenv()
-
-#Step1: Setup API Keys for Groq, OpenAI and Tavily
-import os
-
-GROQ_API_KEY=os.environ.get("GROQ_API_KEY")
-TAVILY_API_KEY=os.environ.get("TAVILY_API_KEY")
-OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY")
-
-#Step2: Setup LLM & Tools
-from langchain_groq import ChatGroq
-from langchain_openai import ChatOpenAI
-from langchain_community.tools.tavily_search import TavilySearchResults
-
-openai_llm=ChatOpenAI(model="gpt-4o-mini")
-groq_llm=ChatGroq(model="llama-3.3-70b-versatile")
-
-search_tool=TavilySearchResults(max_results=2)
-
-#Step3: Setup AI Agent with Search tool functionality
-from langgraph.prebuilt import create_react_agent
-from langchain_core.messages.ai import AIMessage
-
-system_prompt="Act as an AI chatbot who is smart and friendly"
-
-def get_response_from_ai_agent(llm_id, query, allow_search, system_prompt, provider):
-    if provider == "Groq":
-        llm = ChatGroq(model=llm_id)
-    elif provider == "OpenAI":
-        llm = ChatOpenAI(model=llm_id)
-
-    tools = [TavilySearchResults(max_results=2)] if allow_search else []
-
-    # Prepend the system prompt as an AIMessage (or use system prompt setting if supported)
-    messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
-    messages += [{"role": "user", "content": q} for q in query]
-
-    agent = create_react_agent(
-        model=llm,
-        tools=tools,
-    )
-
-    state = {"messages": messages}
-
-    response = agent.invoke(state)
-    from langchain_core.messages.ai import AIMessage
-    ai_messages = [message.content for message in response.get("messages", []) if isinstance(message, AIMessage)]
-    
-    return ai_messages[-1] if ai_messages else "No response received from agent."
\ No newline at end of file
+# if you dont use pipenv uncomment the following:
+# from dotenv import load_dotenv
+# load_dotenv()
+
+#Step1: Setup API Keys for Groq, OpenAI and Tavily
+import os
+import json
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+GROQ_API_KEY=os.environ.get("GROQ_API_KEY")
+TAVILY_API_KEY=os.environ.get("TAVILY_API_KEY")
+OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY")
+
+# Maximum number of compiled agents kept warm at once
+AGENT_REGISTRY_MAX_SIZE=int(os.environ.get("AGENT_REGISTRY_MAX_SIZE", "16"))
+
+# Maximum number of in-flight async LLM calls per provider
+PROVIDER_CONCURRENCY = {
+    "Groq": int(os.environ.get("GROQ_MAX_CONCURRENCY", "256")),
+    "OpenAI": int(os.environ.get("OPENAI_MAX_CONCURRENCY", "256")),
+}
+
+#Step2: Setup LLM & Tools
+# Provider SDKs and langgraph are slow to import, they load on first use
+from search_tool import CachedSearch
+
+
+def _chat_groq(llm_id):
+    from langchain_groq import ChatGroq
+    return ChatGroq(model=llm_id)
+
+
+def _chat_openai(llm_id):
+    from langchain_openai import ChatOpenAI
+    # stream_usage makes streamed runs report token usage too
+    return ChatOpenAI(model=llm_id, stream_usage=True)
+
+
+PROVIDER_FACTORIES = {
+    "Groq": _chat_groq,
+    "OpenAI": _chat_openai,
+}
+
+#Step3: Setup AI Agent with Search tool functionality
+from langchain_core.messages.ai import AIMessage
+from langchain_core.messages import messages_from_dict, messages_to_dict
+from langchain_core.callbacks import BaseCallbackHandler
+from tokens import count_message_tokens, count_tokens, token_ledger
+from router import router, is_retryable
+from cache import make_key, normalize_text
+from singleflight import SingleFlight
+from metrics import prompt_tokens_total, stage_seconds, time_to_first_token_seconds
+from cassette import cassette
+from scheduler import scheduler, ENDPOINT_PRIORITIES, EXPECTED_COMPLETION_TOKENS, PRIORITY_INTERACTIVE
+
+system_prompt="Act as an AI chatbot who is smart and friendly"
+
+
+class AgentRegistry:
+    """Thread-safe LRU pool of LLM clients and compiled ReAct agents.
+
+    Agents are keyed by (provider, llm_id, allow_search). LLM clients are
+    keyed by (provider, llm_id) so the search and no-search agents of one
+    model share the same HTTP connection pool.
+    """
+
+    def __init__(self, max_size=AGENT_REGISTRY_MAX_SIZE):
+        self.max_size = max_size
+        self._agents = OrderedDict()
+        self._llms = {}
+        self._search_tool = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key):
+        # Called with the lock held
+        agent = self._agents.get(key)
+        if agent is not None:
+            self._agents.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+        return agent
+
+    def _get_search_tool(self):
+        search_tool = self._search_tool
+        if search_tool is None:
+            from langchain_community.tools.tavily_search import TavilySearchResults
+            # One cached search tool shared by every search-enabled agent
+            search_tool = CachedSearch(TavilySearchResults(max_results=2)).as_tool()
+            with self._lock:
+                if self._search_tool is None:
+                    self._search_tool = search_tool
+                search_tool = self._search_tool
+        return search_tool
+
+    def get_llm(self, provider, llm_id):
+        """Return the shared LLM client for a model, creating it on first use"""
+        key = (provider, llm_id)
+        with self._lock:
+            llm = self._llms.get(key)
+        if llm is None:
+            if provider not in PROVIDER_FACTORIES:
+                raise ValueError(f"Unknown model provider: {provider}")
+            # Built outside the lock, the first use imports the provider SDK
+            llm = PROVIDER_FACTORIES[provider](llm_id)
+            with self._lock:
+                llm = self._llms.setdefault(key, llm)
+        return llm
+
+    def get_agent(self, provider, llm_id, allow_search):
+        """Return a compiled agent, building and caching it on first use"""
+        key = (provider, llm_id, bool(allow_search))
+        with self._lock:
+            agent = self._lookup(key)
+        return agent if agent is not None else self._build_agent(key)
+
+    async def aget_llm(self, provider, llm_id):
+        """get_llm for the event loop, a new client is built in a worker thread"""
+        with self._lock:
+            llm = self._llms.get((provider, llm_id))
+        return llm if llm is not None else await asyncio.to_thread(self.get_llm, provider, llm_id)
+
+    async def aget_agent(self, provider, llm_id, allow_search):
+        """get_agent for the event loop, a new agent is built in a worker thread"""
+        key = (provider, llm_id, bool(allow_search))
+        with self._lock:
+            agent = self._lookup(key)
+        return agent if agent is not None else await asyncio.to_thread(self._build_agent, key)
+
+    def _build_agent(self, key):
+        provider, llm_id, allow_search = key
+        with stage_seconds.time(stage="agent_build"):
+            from langgraph.prebuilt import create_react_agent
+            tools = [self._get_search_tool()] if allow_search else []
+            agent = create_react_agent(
+                model=self.get_llm(provider, llm_id),
+                tools=tools,
+            )
+        with self._lock:
+            # Another request may have built the same agent meanwhile, keep the first
+            existing = self._agents.get(key)
+            if existing is not None:
+                return existing
+            self._agents[key] = agent
+            while len(self._agents) > self.max_size:
+                (old_provider, old_llm_id, _), _ = self._agents.popitem(last=False)
+                self.evictions += 1
+                # Drop the LLM client once no remaining agent uses it
+                if not any(k[:2] == (old_provider, old_llm_id) for k in self._agents):
+                    self._llms.pop((old_provider, old_llm_id), None)
+        return agent
+
+    def stats(self):
+        """Return hit/miss counters and the current reuse rate"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._agents),
+                "max_size": self.max_size,
+                "llm_clients": len(self._llms),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._agents.clear()
+            self._llms.clear()
+            self._search_tool = None
+
+
+agent_registry = AgentRegistry()
+
+
+async def _open_connection(llm):
+    """Make a free authenticated request so the client's pool holds a live connection"""
+    # ChatOpenAI keeps the SDK client as root_async_client, ChatGroq behind async_client
+    client = getattr(llm, "root_async_client", None) or getattr(getattr(llm, "async_client", None), "_client", None)
+    if client is None or not hasattr(client, "models"):
+        return False
+    await client.models.list()
+    return True
+
+
+async def warm_up(models, allow_search=False):
+    """Pre-build agents and open provider connections for (provider, llm_id) pairs.
+
+    Returns one report entry per model. Failures are reported rather than
+    raised so a single bad entry cannot keep a worker from serving.
+    """
+    count_tokens("warm up")  # Loads the tokenizer
+
+    async def warm(provider, llm_id):
+        entry = {"provider": provider, "model": llm_id}
+        started = time.perf_counter()
+        try:
+            # Replay needs neither clients nor network
+            if not cassette.replaying:
+                for search in ((False, True) if allow_search else (False,)):
+                    await agent_registry.aget_agent(provider, llm_id, search)
+                entry["connected"] = await _open_connection(await agent_registry.aget_llm(provider, llm_id))
+            entry["ok"] = True
+        except Exception as e:
+            entry.update(ok=False, error=str(e))
+        entry["seconds"] = round(time.perf_counter() - started, 3)
+        return entry
+
+    return list(await asyncio.gather(*(warm(provider, llm_id) for provider, llm_id in models)))
+
+
+_provider_semaphores = {}
+
+
+def _get_provider_semaphore(provider):
+    semaphore = _provider_semaphores.get(provider)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(PROVIDER_CONCURRENCY.get(provider, 64))
+        _provider_semaphores[provider] = semaphore
+    return semaphore
+
+
+def _build_state(query, system_prompt):
+    # Prepend the system prompt as an AIMessage (or use system prompt setting if supported)
+    messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+    # Plain strings are user turns, dicts carry their own role (session history)
+    messages += [q if isinstance(q, dict) else {"role": "user", "content": q} for q in query]
+    return {"messages": messages}
+
+
+def _extract_response(response):
+    ai_messages = [message.content for message in response.get("messages", []) if isinstance(message, AIMessage)]
+    return ai_messages[-1] if ai_messages else "No response received from agent."
+
+
+def _sum_usage(messages):
+    """Add up provider-reported usage over AIMessages, None if none was reported"""
+    usage = None
+    for message in messages:
+        metadata = getattr(message, "usage_metadata", None)
+        if metadata:
+            usage = usage or {"prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0}
+            usage["prompt_tokens"] += metadata.get("input_tokens", 0)
+            # Providers with prompt caching report the prefix tokens they served from it
+            usage["cached_prompt_tokens"] += (metadata.get("input_token_details") or {}).get("cache_read", 0)
+            usage["completion_tokens"] += metadata.get("output_tokens", 0)
+    return usage
+
+
+def _record_usage(endpoint, provider, llm_id, query, system_prompt, answer, reported):
+    """Record token usage in the ledger, estimating it if the provider reported none"""
+    usage = reported
+    if usage is None:
+        usage = {
+            "prompt_tokens": count_message_tokens(query, system_prompt),
+            "cached_prompt_tokens": 0,
+            "completion_tokens": count_tokens(answer),
+        }
+    else:
+        cached = usage["cached_prompt_tokens"]
+        prompt_tokens_total.inc(cached, endpoint=endpoint, provider=provider, model=llm_id, cache="hit")
+        prompt_tokens_total.inc(usage["prompt_tokens"] - cached, endpoint=endpoint, provider=provider, model=llm_id, cache="miss")
+    token_ledger.record(
+        endpoint, provider, llm_id, usage["prompt_tokens"], usage["completion_tokens"],
+        estimated=reported is None, cached_prompt_tokens=usage["cached_prompt_tokens"]
+    )
+    return dict(usage, estimated=reported is None)
+
+
+async def _admit(provider, llm_id, endpoint, query, system_prompt):
+    """Wait for the provider's rate limits, returns the tokens reserved for the call"""
+    reserved = count_message_tokens(query, system_prompt) + EXPECTED_COMPLETION_TOKENS.get(endpoint, 400)
+    if cassette.replaying:
+        return reserved  # Replay sends nothing to the provider
+    await scheduler.acquire(provider, llm_id, ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_INTERACTIVE), reserved)
+    return reserved
+
+
+def _settle(provider, llm_id, reserved, reported):
+    # Without reported usage the reservation stands as the best estimate
+    if reported is not None and not cassette.replaying:
+        scheduler.settle(provider, llm_id, reserved, reported["prompt_tokens"] + reported["completion_tokens"])
+
+
+class StageTimer(BaseCallbackHandler):
+    """Times every model and tool run inside an agent for the stage histograms"""
+
+    run_inline = True
+
+    def __init__(self):
+        self._started = {}
+
+    def _start(self, run_id):
+        self._started[run_id] = time.perf_counter()
+
+    def _stop(self, run_id, stage):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            stage_seconds.observe(time.perf_counter() - started, stage=stage)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._stop(run_id, "llm_call")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._stop(run_id, "llm_call")
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._stop(run_id, "tool_call")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._stop(run_id, "tool_call")
+
+
+# Run ids are unique, one handler serves every concurrent agent run
+AGENT_CONFIG = {"callbacks": [StageTimer()]}
+
+
+# Identical concurrent requests share one upstream LLM call
+single_flight = SingleFlight()
+
+
+def request_fingerprint(llm_id, query, allow_search, system_prompt, provider):
+    """Normalized key identifying an agent request"""
+    messages = [
+        [q["role"], normalize_text(q["content"])] if isinstance(q, dict) else ["user", normalize_text(q)]
+        for q in query
+    ]
+    return make_key(provider, llm_id, system_prompt, messages, bool(allow_search))
+
+
+def _invoke_agent(provider, llm_id, allow_search, query, system_prompt):
+    """Blocking agent call, served from or saved to the cassette when enabled"""
+    key = request_fingerprint(llm_id, query, allow_search, system_prompt, provider)
+    if cassette.replaying:
+        return {"messages": messages_from_dict(cassette.replay("agent", key))}
+    started = time.perf_counter()
+    agent = agent_registry.get_agent(provider, llm_id, allow_search)
+    state = _build_state(query, system_prompt)
+    response = agent.invoke(state, config=AGENT_CONFIG)
+    if cassette.recording:
+        # Only what the agent added, the request itself is captured by the fingerprint
+        added = response["messages"][len(state["messages"]):]
+        cassette.record("agent", key, messages_to_dict(added), time.perf_counter() - started)
+    return response
+
+
+async def _ainvoke_agent(provider, llm_id, allow_search, query, system_prompt):
+    """Async agent call, served from or saved to the cassette when enabled"""
+    key = request_fingerprint(llm_id, query, allow_search, system_prompt, provider)
+    if cassette.replaying:
+        return {"messages": messages_from_dict(await cassette.areplay("agent", key))}
+    started = time.perf_counter()
+    agent = await agent_registry.aget_agent(provider, llm_id, allow_search)
+    state = _build_state(query, system_prompt)
+    response = await agent.ainvoke(state, config=AGENT_CONFIG)
+    if cassette.recording:
+        # Only what the agent added, the request itself is captured by the fingerprint
+        added = response["messages"][len(state["messages"]):]
+        cassette.record("agent", key, messages_to_dict(added), time.perf_counter() - started)
+    return response
+
+
+async def _ainvoke_structured(provider, llm_id, query, system_prompt, schema, key):
+    """One model call forced to answer through the schema's tool, cassette aware"""
+    if cassette.replaying:
+        return messages_from_dict(await cassette.areplay("structured", key))[0]
+    started = time.perf_counter()
+    llm = (await agent_registry.aget_llm(provider, llm_id)).bind_tools([schema], tool_choice=schema.__name__)
+    message = await llm.ainvoke(_build_state(query, system_prompt)["messages"], config=AGENT_CONFIG)
+    if cassette.recording:
+        cassette.record("structured", key, messages_to_dict([message]), time.perf_counter() - started)
+    return message
+
+
+def get_response_from_ai_agent(llm_id, query, allow_search, system_prompt, provider, endpoint="chat"):
+    try:
+        response = _invoke_agent(provider, llm_id, allow_search, query, system_prompt)
+    except Exception as e:
+        # The blocking path cannot hedge, but it still fails over on 429/5xx
+        fallback = router.fallback(provider, llm_id)
+        if not (router.policy(endpoint)["failover"] and fallback and is_retryable(e)):
+            raise
+        router.count("failovers")
+        provider, llm_id = fallback
+        response = _invoke_agent(provider, llm_id, allow_search, query, system_prompt)
+    answer = _extract_response(response)
+    _record_usage(endpoint, provider, llm_id, query, system_prompt, answer, _sum_usage(response.get("messages", [])))
+    return answer
+
+
+async def aget_response_from_ai_agent(llm_id, query, allow_search, system_prompt, provider, endpoint="chat", return_usage=False):
+    """Async variant of get_response_from_ai_agent bounded per provider.
+
+    The call goes through the router, which may hedge or fail over to the
+    alternate provider according to the endpoint's policy. With
+    return_usage=True it returns (answer, usage) where usage holds the
+    prompt and completion token counts and the provider/model that served it.
+    """
+    async def invoke(route_provider, route_llm_id, started):
+        reserved = await _admit(route_provider, route_llm_id, endpoint, query, system_prompt)
+        async with _get_provider_semaphore(route_provider):
+            started()
+            response = await _ainvoke_agent(route_provider, route_llm_id, allow_search, query, system_prompt)
+        _settle(route_provider, route_llm_id, reserved, _sum_usage(response.get("messages", [])))
+        return response
+
+    async def upstream():
+        response, (served_provider, served_llm_id) = await router.call(endpoint, provider, llm_id, invoke)
+        answer = _extract_response(response)
+        usage = _record_usage(endpoint, served_provider, served_llm_id, query, system_prompt, answer, _sum_usage(response.get("messages", [])))
+        usage["served_by"] = {"provider": served_provider, "model": served_llm_id}
+        return answer, usage
+
+    key = request_fingerprint(llm_id, query, allow_search, system_prompt, provider)
+    # Only the leader's call is recorded in the token ledger
+    answer, usage = await single_flight.call(key, upstream)
+    return (answer, dict(usage)) if return_usage else answer
+
+
+async def aget_structured_response(llm_id, query, system_prompt, provider, schema, endpoint="quiz", return_served=False):
+    """Ask the model for output matching a pydantic schema through tool calling.
+
+    No agent loop runs, but the call still goes through the router,
+    rate-limit scheduler and token ledger. Returns the raw AIMessage so the
+    caller can validate the tool-call arguments piece by piece instead of
+    losing the whole reply to one invalid field. With return_served=True it
+    returns (message, served_by), the provider/model that answered.
+    """
+    def fingerprint(route_provider, route_llm_id):
+        return make_key(request_fingerprint(route_llm_id, query, False, system_prompt, route_provider), schema.__name__)
+
+    async def invoke(route_provider, route_llm_id, started):
+        reserved = await _admit(route_provider, route_llm_id, endpoint, query, system_prompt)
+        async with _get_provider_semaphore(route_provider):
+            started()
+            message = await _ainvoke_structured(
+                route_provider, route_llm_id, query, system_prompt, schema, fingerprint(route_provider, route_llm_id)
+            )
+        _settle(route_provider, route_llm_id, reserved, _sum_usage([message]))
+        return message
+
+    async def upstream():
+        message, (served_provider, served_llm_id) = await router.call(endpoint, provider, llm_id, invoke)
+        # The tool-call arguments are the completion, the text is usually empty
+        completion = _message_text(message.content) + json.dumps([call["args"] for call in message.tool_calls])
+        _record_usage(endpoint, served_provider, served_llm_id, query, system_prompt, completion, _sum_usage([message]))
+        return message, {"provider": served_provider, "model": served_llm_id}
+
+    message, served_by = await single_flight.call(fingerprint(provider, llm_id), upstream)
+    return (message, dict(served_by)) if return_served else message
+
+
+def _message_text(content):
+    # Chunks may carry a list of content blocks instead of a plain string
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+
+async def astream_response_from_ai_agent(llm_id, query, allow_search, system_prompt, provider, endpoint="chat"):
+    """Yield token and tool events from the agent as they are produced.
+
+    Each item is a dict with an "event" key: "token" (with "content"),
+    "tool_start"/"tool_end" (with "name" and "input"/"output"), and a final
+    "done" carrying the full "response" of the last model turn and its "usage",
+    which includes the provider's time to first event as "ttft_seconds".
+    A retryable error before anything was streamed fails over to the
+    alternate provider; a stream cannot be hedged. Identical concurrent
+    streams share one upstream run.
+    """
+    key = request_fingerprint(llm_id, query, allow_search, system_prompt, provider)
+    async for event in single_flight.stream(
+        key,
+        lambda: _astream_with_failover(llm_id, query, allow_search, system_prompt, provider, endpoint)
+    ):
+        yield event
+
+
+async def _astream_with_failover(llm_id, query, allow_search, system_prompt, provider, endpoint):
+    fallback = router.fallback(provider, llm_id)
+    can_fail_over = router.policy(endpoint)["failover"] and fallback is not None
+    while True:
+        emitted = False
+        try:
+            async for event in _astream_agent_events(llm_id, query, allow_search, system_prompt, provider, endpoint):
+                emitted = True
+                if event["event"] == "done":
+                    usage = _record_usage(endpoint, provider, llm_id, query, system_prompt, event["response"], event.pop("reported_usage"))
+                    usage["served_by"] = {"provider": provider, "model": llm_id}
+                    usage["ttft_seconds"] = event.pop("ttft")
+                    if usage["ttft_seconds"] is not None and not usage["estimated"]:
+                        time_to_first_token_seconds.observe(
+                            usage["ttft_seconds"], endpoint=endpoint, provider=provider,
+                            prompt_cache="hit" if usage["cached_prompt_tokens"] else "miss"
+                        )
+                    event["usage"] = usage
+                yield event
+            return
+        except Exception as e:
+            if emitted or not can_fail_over or not is_retryable(e):
+                raise
+            router.count("failovers")
+            provider, llm_id = fallback
+            can_fail_over = False
+
+
+async def _astream_agent_events(llm_id, query, allow_search, system_prompt, provider, endpoint):
+    reserved = await _admit(provider, llm_id, endpoint, query, system_prompt)
+    key = request_fingerprint(llm_id, query, allow_search, system_prompt, provider)
+    async with _get_provider_semaphore(provider):
+        started = time.perf_counter()
+        ttft = None
+        if cassette.replaying:
+            events = cassette.replay_stream("agent_stream", key)
+        else:
+            events = _agent_events(await agent_registry.aget_agent(provider, llm_id, allow_search), query, system_prompt)
+            if cassette.recording:
+                events = cassette.record_stream("agent_stream", key, events)
+        async for event in events:
+            if event["event"] == "done":
+                _settle(provider, llm_id, reserved, event["reported_usage"])
+                event["ttft"] = ttft
+            elif ttft is None:
+                # First token or tool call, measured after queueing so only the provider counts
+                ttft = time.perf_counter() - started
+            yield event
+
+
+async def _agent_events(agent, query, system_prompt):
+    final_text = ""
+    model_outputs = []
+    async for event in agent.astream_events(_build_state(query, system_prompt), config=AGENT_CONFIG, version="v2"):
+        kind = event["event"]
+        if kind == "on_chat_model_start":
+            # A new model turn begins, only the last one is the answer
+            final_text = ""
+        elif kind == "on_chat_model_stream":
+            token = _message_text(event["data"]["chunk"].content)
+            if token:
+                final_text += token
+                yield {"event": "token", "content": token}
+        elif kind == "on_chat_model_end":
+            model_outputs.append(event["data"].get("output"))
+        elif kind == "on_tool_start":
+            yield {"event": "tool_start", "name": event["name"], "input": event["data"].get("input")}
+        elif kind == "on_tool_end":
+            output = event["data"].get("output")
+            output = getattr(output, "content", output)
+            yield {"event": "tool_end", "name": event["name"], "output": str(output)[:500]}
+    yield {
+        "event": "done",
+        "response": final_text or "No response received from agent.",
+        "reported_usage": _sum_usage(model_outputs)
+    }
@@ -1,232 +1,714 @@
-# if you dont use pipenv uncomment the following:
-# from dotenv import load_dotenv
-# load_dotenv()
-
-# Step1: Setup Pydantic Model (Schema Validation)
-from pydantic import BaseModel
-from typing import List, Dict, Any
-from fastapi import FastAPI, HTTPException
-import requests
-import json
-import base64
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-import os
-import re  # Added for improved JSON parsing
-
-# Step2: Setup AI Agent from FrontEnd Request
-from ai_agent import get_response_from_ai_agent
-
-class RequestState(BaseModel):
-    model_name: str
-    model_provider: str
-    system_prompt: str
-    messages: List[str]
-    allow_search: bool
-    language: str
-
-class QuizRequest(BaseModel):
-    topic: str
-    language: str
-    model_name: str
-    model_provider: str
-
-ALLOWED_MODEL_NAMES = ["llama3-70b-8192", "mixtral-8x7b-32768", "llama-3.3-70b-versatile", "gpt-4o-mini"]
-
-app = FastAPI(title="LangGraph AI Agent")
-
-# Language-specific system prompt enhancements
-LANGUAGE_PROMPTS = {
-    "hi-IN": "\n\nकृपया हिंदी में उत्तर दें। सरल और स्पष्ट भाषा का प्रयोग करें।",
-    "bn-IN": "\n\nঅনুগ্রহ করে বাংলায় উত্তর দিন। সহজ এবং স্পষ্ট ভাষা ব্যবহার করুন।",
-    "mr-IN": "\n\nकृपया मराठीत उत्तर द्या. सोपी आणि स्पष्ट भाषा वापरा.",
-    "ta-IN": "\n\nதமிழில் பதிலளிக்கவும். எளிய மற்றும் தெளிவான மொழியைப் பயன்படுத்தவும்.",
-    "te-IN": "\n\nదయచేసి తెలుగులో జవాబు ఇవ్వండి. సరళమైన మరియు స్పష్టమైన భాషను ఉపయోగించండి.",
-    "gu-IN": "\n\nકૃપા કરીને ગુજરાતીમાં જવાબ આપો. સરળ અને સ્પષ્ટ ભાષા નો ઉપયોગ કરો.",
-    "kn-IN": "\n\nದಯವಿಟ್ಟು ಕನ್ನಡದಲ್ಲಿ ಉತ್ತರಿಸಿ. ಸರಳ ಮತ್ತು ಸ್ಪಷ್ಟ ಭಾಷೆಯನ್ನು ಬಳಸಿ.",
-    "ml-IN": "\n\nദയവായി മലയാളത്തിൽ മറുപടി നൽകുക. ലളിതവും വ്യക്തവുമായ ഭാഷ ഉപയോഗിക്കുക.",
-    "pa-IN": "\n\nਕਿਰਪਾ ਕਰਕੇ ਪੰਜਾਬੀ ਵਿੱਚ ਜਵਾਬ ਦਿਓ। ਸਧਾਰਨ ਅਤੇ ਸਪਸ਼ਟ ਭਾਸ਼ਾ ਦੀ ਵਰਤੋਂ ਕਰੋ।",
-    "ur-IN": "\n\nبراہ کرم اردو میں جواب دیں۔ سادہ اور واضح زبان استعمال کریں۔"
-}
-
-def create_pdf(content, filename, language):
-    """Create a PDF file with quiz content"""
-    try:
-        # Create PDF with language-appropriate font
-        pdf_path = f"{filename}.pdf"
-        doc = SimpleDocTemplate(pdf_path, pagesize=letter)
-        styles = getSampleStyleSheet()
-        flowables = []
-        
-        # Add title based on filename
-        if "with_answers" in filename:
-            title = "Quiz with Answers" if language.startswith("en") else "उत्तरों के साथ प्रश्नोत्तरी"
-        else:
-            title = "Quiz Questions" if language.startswith("en") else "प्रश्नोत्तरी"
-            
-        flowables.append(Paragraph(f"<b>{title}</b>", styles['Title']))
-        flowables.append(Spacer(1, 12))
-        
-        # Check if content is a list of questions
-        if isinstance(content, list) and all(isinstance(q, dict) for q in content):
-            for idx, item in enumerate(content):
-                # Question
-                q_text = f"<b>Q{idx+1}: {item.get('question', '')}</b>"
-                flowables.append(Paragraph(q_text, styles['Normal']))
-                
-                # Options
-                options = item.get('options', [])
-                for i, option in enumerate(options):
-                    flowables.append(Paragraph(f"{chr(65+i)}. {option}", styles['Normal']))
-                
-                # Answer and explanation (only for answers PDF)
-                if "with_answers" in filename:
-                    answer = item.get('answer', '')
-                    explanation = item.get('explanation', '')
-                    flowables.append(Paragraph(f"<b>Answer:</b> {answer}", styles['Normal']))
-                    if explanation:
-                        flowables.append(Paragraph(f"<i>Explanation:</i> {explanation}", styles['Normal']))
-                
-                flowables.append(Spacer(1, 12))
-        else:
-            # Handle text content
-            flowables.append(Paragraph(f"<b>Content:</b> {str(content)}", styles['Normal']))
-        
-        doc.build(flowables)
-        
-        # Read the created PDF
-        with open(pdf_path, "rb") as f:
-            pdf_bytes = f.read()
-        
-        # Clean up temporary file
-        os.remove(pdf_path)
-        
-        return pdf_bytes
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"PDF creation failed: {str(e)}")
-
-@app.post("/chat")
-def chat_endpoint(request: RequestState) -> Dict[str, Any]:
-    """
-    API Endpoint to interact with the Chatbot using LangGraph and search tools.
-    It dynamically selects the model specified in the request
-    """
-    if request.model_name not in ALLOWED_MODEL_NAMES:
-        return {"error": "Invalid model name. Kindly select a valid AI model"}
-    
-    llm_id = request.model_name
-    query = request.messages
-    allow_search = request.allow_search
-    system_prompt = request.system_prompt
-    provider = request.model_provider
-    language = request.language
-
-    # Add language-specific instruction if available
-    if language in LANGUAGE_PROMPTS:
-        system_prompt += LANGUAGE_PROMPTS[language]
-    else:
-        # Default instruction for other languages
-        system_prompt += f"\n\nPlease respond in {language} language. Use simple and clear language."
-
-    # Create AI Agent and get response from it! 
-    try:
-        response = get_response_from_ai_agent(llm_id, query, allow_search, system_prompt, provider)
-        return {"response": response}
-    except Exception as e:
-        return {"error": f"Error processing request: {str(e)}"}
-
-@app.post("/generate_quiz")
-def generate_quiz(request: QuizRequest):
-    """Generate a quiz PDF based on a topic"""
-    try:
-        # Generate quiz using the AI model
-        prompt = f"""
-        Generate a 10-question quiz about the following topic. 
-        For each question, provide:
-        - The question text
-        - 4 multiple choice options (labeled A, B, C, D)
-        - The correct answer (specify the letter)
-        - A brief explanation of why it's correct
-        
-        Topic: {request.topic}
-        
-        Format the response as a JSON array of objects with these keys:
-        "question", "options", "answer", "explanation"
-        
-        Return ONLY the JSON array without any additional text.
-        """
-        
-        # Get quiz content from AI
-        quiz_data = get_response_from_ai_agent(
-            request.model_name,
-            [prompt],
-            False,  # Don't allow web search for quiz
-            "You are an expert quiz creator who creates educational quizzes. Return only JSON format.",
-            request.model_provider
-        )
-        
-        # Improved JSON extraction
-        try:
-            # Find the first [ and last ] to extract JSON array
-            start_index = quiz_data.find('[')
-            end_index = quiz_data.rfind(']') + 1
-            json_str = quiz_data[start_index:end_index]
-            quiz_questions = json.loads(json_str)
-        except Exception as e:
-            # If parsing fails, try to extract with regex
-            try:
-                json_match = re.search(r'\[.*\]', quiz_data, re.DOTALL)
-                if json_match:
-                    quiz_questions = json.loads(json_match.group())
-                else:
-                    quiz_questions = [{
-                        "question": "Quiz parsing error",
-                        "options": ["A: Error in parsing", "B: Contact support"],
-                        "answer": "A",
-                        "explanation": f"Original response: {quiz_data}"
-                    }]
-            except:
-                quiz_questions = [{
-                    "question": "Quiz parsing error",
-                    "options": ["A: Critical error", "B: Try again later"],
-                    "answer": "A",
-                    "explanation": quiz_data
-                }]
-        
-        # Create PDF with questions and answers
-        qa_pdf = create_pdf(
-            quiz_questions, 
-            "quiz_with_answers", 
-            request.language
-        )
-        
-        # Create PDF with only questions (using same structure)
-        questions_only = []
-        for q in quiz_questions:
-            questions_only.append({
-                "question": q.get("question", ""),
-                "options": q.get("options", [])
-            })
-        
-        questions_pdf = create_pdf(
-            questions_only, 
-            "quiz_questions", 
-            request.language
-        )
-        
-        # Return base64 encoded PDFs
-        return {
-            "quiz_with_answers": base64.b64encode(qa_pdf).decode('utf-8'),
-            "quiz_questions": base64.b64encode(questions_pdf).decode('utf-8'),
-            "quiz_data": quiz_questions  # Return structured data for frontend
-        }
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Quiz generation failed: {str(e)}")
-
-# Step3: Run app & Explore Swagger UI Docs
-if __name__ == "__main__":
-    import uvicorn
+# if you dont use pipenv uncomment the following:
+# from dotenv import load_dotenv
+# load_dotenv()
+
+# Step1: Setup Pydantic Model (Schema Validation)
+from pydantic import BaseModel
+from typing import List, Dict, Any, Optional
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+import requests
+import json
+import time
+import gzip
+import uuid
+import zipfile
+import asyncio
+import multiprocessing
+from contextlib import asynccontextmanager
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import os
+
+# Step2: Setup AI Agent from FrontEnd Request
+from ai_agent import (
+    aget_response_from_ai_agent, aget_structured_response, astream_response_from_ai_agent,
+    PROVIDER_FACTORIES, agent_registry, single_flight, warm_up
+)
+from router import router
+from scheduler import scheduler
+from metrics import CONTENT_TYPE, MetricsMiddleware, quiz_questions_total, registry, requests_total, stage_seconds
+from search_tool import search_cache
+from cassette import cassette
+from cache import make_cache, make_key, normalize_text
+from quiz_pdf import PDFRenderError, build_quiz_entry
+from quiz_parser import (
+    IncrementalJSONArrayParser, Quiz, extract_quiz_items, parse_quiz_questions, quiz_error_placeholder,
+    validate_quiz_questions
+)
+from sessions import SessionStore
+from prompts import LANGUAGE_PROMPTS, QUIZ_SYSTEM_PROMPT, chat_system_prompt, quiz_user_prompt
+from question_bank import QUESTION_BANK_ENABLED, QUESTION_BANK_SAME_MODEL, question_bank
+from tokens import (
+    PromptTooLargeError, count_message_tokens, count_tokens, prompt_token_limit,
+    token_ledger, truncate_to_tokens
+)
+
+class RequestState(BaseModel):
+    model_name: str
+    model_provider: str
+    system_prompt: str
+    messages: List[str]
+    allow_search: bool
+    language: str
+    session_id: Optional[str] = None  # Keep server-side history for this conversation
+
+class QuizRequest(BaseModel):
+    topic: str
+    language: str
+    model_name: str
+    model_provider: str
+    regenerate: bool = False  # Bypass the quiz cache and build a fresh quiz
+
+QUIZ_PDF_VARIANTS = ("with_answers", "questions")
+
+QUIZ_LENGTH = 10
+# Follow-up calls that only ask for the questions still missing or invalid
+QUIZ_REPAIR_ATTEMPTS = int(os.environ.get("QUIZ_REPAIR_ATTEMPTS", "2"))
+
+session_store = SessionStore()
+
+# Bulk quiz generation: LLM calls in flight per batch and PDF rendering processes
+QUIZ_BATCH_CONCURRENCY = int(os.environ.get("QUIZ_BATCH_CONCURRENCY", "8"))
+QUIZ_PDF_WORKERS = int(os.environ.get("QUIZ_PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+ALLOWED_MODEL_NAMES = ["llama3-70b-8192", "mixtral-8x7b-32768", "llama-3.3-70b-versatile", "gpt-4o-mini"]
+
+@asynccontextmanager
+async def lifespan(app):
+    # Warm up in the background so liveness checks pass while /ready says 503;
+    # the reference keeps the task from being garbage-collected mid-run
+    warm_up_task = asyncio.ensure_future(run_warm_up()) if WARMUP_MODELS else None
+    try:
+        yield
+    finally:
+        if warm_up_task is not None and not warm_up_task.done():
+            warm_up_task.cancel()
+        shutdown_pdf_process_pool()
+
+app = FastAPI(title="LangGraph AI Agent", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+
+# Models to pre-build agents and open connections for at startup, e.g.
+# WARMUP_MODELS="Groq:llama-3.3-70b-versatile,OpenAI:gpt-4o-mini"
+WARMUP_MODELS = [
+    tuple(entry.strip().split(":", 1)) for entry in os.environ.get("WARMUP_MODELS", "").split(",") if ":" in entry
+]
+# Also build the web-search agents (needs TAVILY_API_KEY)
+WARMUP_SEARCH = os.environ.get("WARMUP_SEARCH", "false").lower() in ("1", "true", "yes")
+
+readiness = {"ready": not WARMUP_MODELS, "warmup": []}
+
+async def run_warm_up():
+    try:
+        readiness["warmup"] = await warm_up(WARMUP_MODELS, allow_search=WARMUP_SEARCH)
+    finally:
+        readiness["ready"] = True
+
+# Opt-in cache of /chat answers, never used for web-search requests
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+response_cache = make_cache(
+    "responses",
+    ttl=int(os.environ.get("RESPONSE_CACHE_TTL", "3600")),
+    max_bytes=int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+)
+
+# Generated quizzes (questions and both PDFs) addressed by a hash of the request.
+# It doubles as the artifact store behind the /quiz/{quiz_id}/... downloads.
+quiz_cache = make_cache(
+    "quizzes",
+    ttl=int(os.environ.get("QUIZ_CACHE_TTL", str(24 * 3600))),
+    max_bytes=int(os.environ.get("QUIZ_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+)
+
+async def build_chat_messages(request: RequestState, system_prompt):
+    """Messages to send to the agent: session history (if any) plus the new ones"""
+    if request.session_id is None:
+        return request.messages
+    return await session_store.abuild_messages(request.session_id, request.messages, request.model_name, system_prompt)
+
+def check_prompt_size(request: RequestState, messages, system_prompt):
+    """Reject a chat prompt that cannot fit the model before calling the provider"""
+    prompt_tokens = count_message_tokens(messages, system_prompt)
+    limit = prompt_token_limit(request.model_name, "chat")
+    if prompt_tokens > limit:
+        token_ledger.record_rejected("chat", request.model_provider, request.model_name)
+        raise PromptTooLargeError(request.model_name, prompt_tokens, limit)
+
+def response_cache_key(request: RequestState, system_prompt, messages):
+    """Return the cache key for a chat request, or None if it must not be cached"""
+    if not RESPONSE_CACHE_ENABLED or request.allow_search:
+        return None
+    return make_key(
+        request.model_name,
+        request.model_provider,
+        system_prompt,
+        [
+            [m["role"], normalize_text(m["content"])] if isinstance(m, dict) else ["user", normalize_text(m)]
+            for m in messages
+        ]
+    )
+
+def chat_metadata(request: RequestState, cached, usage=None):
+    metadata = {"cached": cached}
+    if usage is not None:
+        metadata["usage"] = usage
+    if request.session_id is not None:
+        metadata["session_id"] = request.session_id
+    return metadata
+
+def served_by_requested(request, served_by):
+    """True if the answer came from the requested model, not a hedge or failover"""
+    return (served_by["provider"], served_by["model"]) == (request.model_provider, request.model_name)
+
+async def record_chat_turn(request: RequestState, response):
+    if request.session_id is not None:
+        await session_store.aappend(request.session_id, request.messages, response)
+
+# Label values come from the client; anything unknown is counted as "other"
+# so requests cannot create new time series
+METRIC_LANGUAGES = set(LANGUAGE_PROMPTS) | {"en-US"}
+
+def _known(value, allowed):
+    return value if value in allowed else "other"
+
+def count_request(endpoint, request, outcome):
+    """Count one API request; outcome is success, cached, rejected or error"""
+    requests_total.inc(
+        endpoint=endpoint,
+        model=_known(request.model_name, ALLOWED_MODEL_NAMES),
+        provider=_known(request.model_provider, PROVIDER_FACTORIES),
+        language=_known(request.language, METRIC_LANGUAGES),
+        outcome=outcome
+    )
+
+def format_sse(event, data):
+    """Encode one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat")
+async def chat_endpoint(request: RequestState) -> Dict[str, Any]:
+    """
+    API Endpoint to interact with the Chatbot using LangGraph and search tools.
+    It dynamically selects the model specified in the request
+    """
+    if request.model_name not in ALLOWED_MODEL_NAMES:
+        count_request("chat", request, "rejected")
+        return {"error": "Invalid model name. Kindly select a valid AI model"}
+    
+    llm_id = request.model_name
+    allow_search = request.allow_search
+    provider = request.model_provider
+    system_prompt = chat_system_prompt(request.system_prompt, request.language)
+    query = await build_chat_messages(request, system_prompt)
+
+    cache_key = response_cache_key(request, system_prompt, query)
+    if cache_key is not None:
+        cached = await response_cache.aget(cache_key)
+        if cached is not None:
+            await record_chat_turn(request, cached)
+            count_request("chat", request, "cached")
+            return {"response": cached, "metadata": chat_metadata(request, cached=True)}
+
+    try:
+        check_prompt_size(request, query, system_prompt)
+    except PromptTooLargeError as e:
+        count_request("chat", request, "rejected")
+        return {"error": str(e)}
+
+    # Create AI Agent and get response from it! 
+    try:
+        response, usage = await aget_response_from_ai_agent(
+            llm_id, query, allow_search, system_prompt, provider, endpoint="chat", return_usage=True
+        )
+        # Another model's answer must not be served later under this model's key
+        if cache_key is not None and served_by_requested(request, usage["served_by"]):
+            await response_cache.aset(cache_key, response)
+        await record_chat_turn(request, response)
+        count_request("chat", request, "success")
+        return {"response": response, "metadata": chat_metadata(request, cached=False, usage=usage)}
+    except Exception as e:
+        count_request("chat", request, "error")
+        return {"error": f"Error processing request: {str(e)}"}
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: RequestState):
+    """
+    Same as /chat but streams the answer as server-sent events:
+    "token", "tool_start", "tool_end", then "done" or "error".
+    """
+    async def event_stream():
+        if request.model_name not in ALLOWED_MODEL_NAMES:
+            count_request("chat_stream", request, "rejected")
+            yield format_sse("error", {"error": "Invalid model name. Kindly select a valid AI model"})
+            return
+
+        system_prompt = chat_system_prompt(request.system_prompt, request.language)
+        query = await build_chat_messages(request, system_prompt)
+
+        cache_key = response_cache_key(request, system_prompt, query)
+        if cache_key is not None:
+            cached = await response_cache.aget(cache_key)
+            if cached is not None:
+                await record_chat_turn(request, cached)
+                count_request("chat_stream", request, "cached")
+                yield format_sse("token", {"content": cached})
+                yield format_sse("done", {"response": cached, "metadata": chat_metadata(request, cached=True)})
+                return
+
+        try:
+            check_prompt_size(request, query, system_prompt)
+        except PromptTooLargeError as e:
+            count_request("chat_stream", request, "rejected")
+            yield format_sse("error", {"error": str(e)})
+            return
+
+        try:
+            async for event in astream_response_from_ai_agent(
+                request.model_name,
+                query,
+                request.allow_search,
+                system_prompt,
+                request.model_provider,
+                endpoint="chat"
+            ):
+                if event["event"] == "done":
+                    if cache_key is not None and served_by_requested(request, event["usage"]["served_by"]):
+                        await response_cache.aset(cache_key, event["response"])
+                    await record_chat_turn(request, event["response"])
+                    count_request("chat_stream", request, "success")
+                    event["metadata"] = chat_metadata(request, cached=False, usage=event.pop("usage"))
+                yield format_sse(event.pop("event"), event)
+        except Exception as e:
+            count_request("chat_stream", request, "error")
+            yield format_sse("error", {"error": f"Error processing request: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str) -> Dict[str, Any]:
+    """Forget a conversation's server-side history"""
+    session_store.clear(session_id)
+    return {"session_id": session_id, "deleted": True}
+
+def quiz_response(quiz_id, entry, cached):
+    """JSON body for a stored quiz: structured questions plus PDF download URLs"""
+    response = {
+        "quiz_id": quiz_id,
+        "quiz_data": entry["quiz_data"],  # Return structured data for frontend
+        "metadata": {"cached": cached}
+    }
+    for variant in QUIZ_PDF_VARIANTS:
+        # The ETag in the query string lets clients cache per quiz version
+        etag = entry["etags"][variant].strip('"')
+        response[f"quiz_{variant}_url"] = f"/quiz/{quiz_id}/{variant}.pdf?v={etag}"
+    return response
+
+def fit_quiz_prompt(request: QuizRequest, endpoint="quiz", count=QUIZ_LENGTH, existing=()):
+    """Build the quiz prompt, truncating the topic so it fits the model's context"""
+    prompt = quiz_user_prompt(request.topic, count, existing)
+    limit = prompt_token_limit(request.model_name, "quiz")
+    overflow = count_message_tokens([prompt], QUIZ_SYSTEM_PROMPT) - limit
+    if overflow <= 0:
+        return prompt
+    token_ledger.record_truncated(endpoint, request.model_provider, request.model_name)
+    topic = truncate_to_tokens(request.topic, count_tokens(request.topic) - overflow)
+    return quiz_user_prompt(topic, count, existing)
+
+def quiz_cache_key(request: QuizRequest):
+    return make_key(request.topic, request.language, request.model_name, request.model_provider)
+
+def quiz_cacheable(request: QuizRequest, parsed_ok, served):
+    """Cache a quiz only if it parsed and every generated question came from the requested model"""
+    return parsed_ok and all(served_by is None or served_by_requested(request, served_by) for served_by in served)
+
+async def store_quiz(quiz_key, quiz_questions, cacheable, language, render=run_in_threadpool):
+    """Render and store a quiz, returns (quiz_id, entry)"""
+    # Create both PDFs in memory; ReportLab is blocking, keep it off the event loop
+    with stage_seconds.time(stage="pdf_render"):
+        entry = await render(build_quiz_entry, quiz_questions, language)
+    # Error placeholders and other models' quizzes get a throwaway ID so they
+    # are never served as cache hits
+    quiz_id = quiz_key if cacheable else uuid.uuid4().hex
+    await quiz_cache.aset(quiz_id, entry)
+    return quiz_id, entry
+
+async def questions_from_bank(request: QuizRequest):
+    """Stored questions matching the topic, none if the bank is off or a fresh quiz was asked for"""
+    if not QUESTION_BANK_ENABLED or request.regenerate:
+        return []
+    model = request.model_name if QUESTION_BANK_SAME_MODEL else None
+    questions = await run_in_threadpool(question_bank.find, request.topic, request.language, QUIZ_LENGTH, model)
+    quiz_questions_total.inc(len(questions), outcome="bank")
+    return questions
+
+async def save_to_bank(request: QuizRequest, questions, served):
+    """Bank new questions tagged with the provider/model that actually wrote each one"""
+    if not QUESTION_BANK_ENABLED:
+        return
+    by_model = {}
+    for question, served_by in zip(questions, served):
+        if served_by is not None:
+            by_model.setdefault((served_by["provider"], served_by["model"]), []).append(question)
+    for (provider, model), model_questions in by_model.items():
+        await run_in_threadpool(question_bank.add, model_questions, request.topic, request.language, provider, model)
+
+async def generate_quiz_questions(request: QuizRequest, endpoint="quiz", questions=(), served=(), attempts=1 + QUIZ_REPAIR_ATTEMPTS, repair=False):
+    """Collect up to QUIZ_LENGTH valid questions through structured output.
+
+    ``questions`` already in hand (from the question bank or a stream) are
+    kept and only the rest is requested. Each question is validated on its
+    own. Follow-up calls ask only for the number still missing, so a few bad
+    questions cost a fraction of a full regeneration. Returns (questions,
+    served): the valid questions, possibly fewer than QUIZ_LENGTH if the
+    attempts run out, and per question the provider/model that wrote it
+    (None for questions passed in without one in ``served``).
+    """
+    questions = list(questions)
+    served = list(served) + [None] * (len(questions) - len(served))
+    for _ in range(attempts):
+        missing = QUIZ_LENGTH - len(questions)
+        if missing <= 0:
+            break
+        message, served_by = await aget_structured_response(
+            request.model_name,
+            [fit_quiz_prompt(request, endpoint, missing, [q["question"] for q in questions])],
+            QUIZ_SYSTEM_PROMPT,
+            request.model_provider,
+            Quiz,
+            endpoint=endpoint,
+            return_served=True
+        )
+        with stage_seconds.time(stage="json_extract"):
+            valid, rejected = validate_quiz_questions(extract_quiz_items(message), questions)
+        valid = valid[:missing]
+        quiz_questions_total.inc(len(valid), outcome="regenerated" if repair else "accepted")
+        quiz_questions_total.inc(rejected, outcome="rejected")
+        questions.extend(valid)
+        served.extend([served_by] * len(valid))
+        repair = True
+    return questions, served
+
+async def produce_quiz(request: QuizRequest, render=run_in_threadpool, endpoint="quiz"):
+    """Return (quiz_id, entry, cached) for a quiz request, generating it if needed.
+
+    ``render`` runs the blocking PDF step; the batch endpoint passes a
+    process-pool runner instead of the default threadpool.
+    """
+    quiz_key = quiz_cache_key(request)
+    cached = None if request.regenerate else await quiz_cache.aget(quiz_key)
+    if cached is not None:
+        return quiz_key, cached, True
+
+    # Reuse banked questions on the topic and ask the AI only for the rest
+    bank_questions = await questions_from_bank(request)
+    quiz_questions, served = await generate_quiz_questions(request, endpoint, questions=bank_questions)
+    await save_to_bank(request, quiz_questions[len(bank_questions):], served[len(bank_questions):])
+    parsed_ok = bool(quiz_questions)
+    if not parsed_ok:
+        quiz_questions = quiz_error_placeholder("No valid questions were generated")
+    quiz_id, entry = await store_quiz(
+        quiz_key, quiz_questions, quiz_cacheable(request, parsed_ok, served), request.language, render
+    )
+    return quiz_id, entry, False
+
+@app.post("/generate_quiz")
+async def generate_quiz(request: QuizRequest):
+    """Generate a quiz PDF based on a topic"""
+    try:
+        quiz_id, entry, cached = await produce_quiz(request)
+        count_request("quiz", request, "cached" if cached else "success")
+        return quiz_response(quiz_id, entry, cached)
+    
+    except PDFRenderError as e:
+        count_request("quiz", request, "error")
+        raise HTTPException(status_code=500, detail=str(e))
+    except Exception as e:
+        count_request("quiz", request, "error")
+        raise HTTPException(status_code=500, detail=f"Quiz generation failed: {str(e)}")
+
+@app.post("/generate_quiz/stream")
+async def generate_quiz_stream(request: QuizRequest):
+    """
+    Stream a quiz as server-sent events: one "question" event per question
+    as soon as the model has finished writing it, then "done" with the same
+    body as /generate_quiz once the PDFs are built, or "error". Matching
+    questions from the question bank are sent first; questions that fail
+    validation are dropped and only those are regenerated.
+    """
+    async def event_stream():
+        quiz_key = quiz_cache_key(request)
+        cached = None if request.regenerate else await quiz_cache.aget(quiz_key)
+        if cached is not None:
+            for index, question in enumerate(cached["quiz_data"]):
+                yield format_sse("question", {"index": index, "question": question})
+            count_request("quiz_stream", request, "cached")
+            yield format_sse("done", quiz_response(quiz_key, cached, cached=True))
+            return
+
+        try:
+            # Banked questions on the topic go out first, the AI only writes the rest
+            bank_questions = await questions_from_bank(request)
+            for index, question in enumerate(bank_questions):
+                yield format_sse("question", {"index": index, "question": question})
+
+            parser = IncrementalJSONArrayParser()
+            quiz_questions = list(bank_questions)
+            final_text = ""
+            stream_served_by = None
+            rejected = 0
+            extract_seconds = 0.0
+            if len(quiz_questions) < QUIZ_LENGTH:
+                async for event in astream_response_from_ai_agent(
+                    request.model_name,
+                    [fit_quiz_prompt(request, "quiz", QUIZ_LENGTH - len(bank_questions), [q["question"] for q in bank_questions])],
+                    False,  # Don't allow web search for quiz
+                    QUIZ_SYSTEM_PROMPT,
+                    request.model_provider,
+                    endpoint="quiz"
+                ):
+                    if event["event"] == "token":
+                        started = time.perf_counter()
+                        questions, invalid = validate_quiz_questions(parser.feed(event["content"]), quiz_questions)
+                        extract_seconds += time.perf_counter() - started
+                        rejected += invalid
+                        for question in questions[:QUIZ_LENGTH - len(quiz_questions)]:
+                            yield format_sse("question", {"index": len(quiz_questions), "question": question})
+                            quiz_questions.append(question)
+                    elif event["event"] == "done":
+                        final_text = event["response"]
+                        stream_served_by = event["usage"]["served_by"]
+
+            if final_text and len(quiz_questions) == len(bank_questions):
+                # Nothing streamed as an array, salvage what the full text holds
+                started = time.perf_counter()
+                salvaged, parsed_ok = parse_quiz_questions(final_text)
+                if parsed_ok:
+                    questions, invalid = validate_quiz_questions(salvaged, quiz_questions)
+                    rejected += invalid
+                    for question in questions[:QUIZ_LENGTH - len(quiz_questions)]:
+                        yield format_sse("question", {"index": len(quiz_questions), "question": question})
+                        quiz_questions.append(question)
+                extract_seconds += time.perf_counter() - started
+            stage_seconds.observe(extract_seconds, stage="json_extract")
+            quiz_questions_total.inc(len(quiz_questions) - len(bank_questions), outcome="accepted")
+            quiz_questions_total.inc(rejected, outcome="rejected")
+
+            streamed = len(quiz_questions)
+            served = [None] * len(bank_questions) + [stream_served_by] * (streamed - len(bank_questions))
+            quiz_questions, served = await generate_quiz_questions(
+                request, "quiz", questions=quiz_questions, served=served, attempts=QUIZ_REPAIR_ATTEMPTS, repair=True
+            )
+            for index in range(streamed, len(quiz_questions)):
+                yield format_sse("question", {"index": index, "question": quiz_questions[index]})
+            await save_to_bank(request, quiz_questions[len(bank_questions):], served[len(bank_questions):])
+
+            parsed_ok = bool(quiz_questions)
+            if not parsed_ok:
+                quiz_questions = quiz_error_placeholder(final_text)
+
+            quiz_id, entry = await store_quiz(
+                quiz_key, quiz_questions, quiz_cacheable(request, parsed_ok, served), request.language
+            )
+            count_request("quiz_stream", request, "success")
+            yield format_sse("done", quiz_response(quiz_id, entry, cached=False))
+        except Exception as e:
+            count_request("quiz_stream", request, "error")
+            yield format_sse("error", {"error": f"Quiz generation failed: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+_pdf_process_pool = None
+
+# Forking a threaded server can deadlock the child and copies the whole app;
+# forkserver (spawn where unavailable) starts clean workers that import only quiz_pdf
+PDF_POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+def get_pdf_process_pool():
+    global _pdf_process_pool
+    if _pdf_process_pool is None:
+        _pdf_process_pool = ProcessPoolExecutor(max_workers=QUIZ_PDF_WORKERS, mp_context=PDF_POOL_CONTEXT)
+    return _pdf_process_pool
+
+async def run_in_pdf_process_pool(func, *args):
+    pool = get_pdf_process_pool()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        # A dead worker breaks the whole executor; replace it so later renders work
+        reset_pdf_process_pool(pool)
+        return await asyncio.get_running_loop().run_in_executor(get_pdf_process_pool(), func, *args)
+
+def reset_pdf_process_pool(broken):
+    global _pdf_process_pool
+    # Concurrent failures all see the same broken pool, only the first replaces it
+    if _pdf_process_pool is broken:
+        _pdf_process_pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+def shutdown_pdf_process_pool():
+    if _pdf_process_pool is not None:
+        _pdf_process_pool.shutdown(wait=False, cancel_futures=True)
+
+def build_quiz_zip(results):
+    """Pack the PDFs of finished batch items (and any errors) into one archive"""
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        errors = []
+        for index, item in sorted(results, key=lambda r: r[0]):
+            if "error" in item:
+                errors.append({"index": index, "error": item["error"]})
+                continue
+            for variant in QUIZ_PDF_VARIANTS:
+                archive.writestr(f"{index + 1:02d}_quiz_{variant}.pdf", gzip.decompress(item["entry"]["pdfs"][variant]))
+        if errors:
+            archive.writestr("errors.json", json.dumps(errors, ensure_ascii=False, indent=2))
+    return buffer.getvalue()
+
+@app.post("/generate_quiz/batch")
+async def generate_quiz_batch(quiz_requests: List[QuizRequest], format: str = "ndjson"):
+    """
+    Generate quizzes for many topics at once. LLM calls run concurrently
+    (at most QUIZ_BATCH_CONCURRENCY at a time) and PDFs render on a process pool.
+    format=ndjson streams one JSON line per topic as it completes;
+    format=zip returns a single archive of all PDFs once the batch is done.
+    A failing topic only produces an error for that item.
+    """
+    if format not in ("ndjson", "zip"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'zip'")
+    if not quiz_requests:
+        raise HTTPException(status_code=400, detail="No quiz requests given")
+
+    semaphore = asyncio.Semaphore(QUIZ_BATCH_CONCURRENCY)
+
+    async def run_one(index, quiz_request):
+        async with semaphore:
+            try:
+                quiz_id, entry, cached = await produce_quiz(quiz_request, render=run_in_pdf_process_pool, endpoint="quiz_batch")
+                count_request("quiz_batch", quiz_request, "cached" if cached else "success")
+                return index, {"quiz_id": quiz_id, "entry": entry, "cached": cached}
+            except Exception as e:
+                count_request("quiz_batch", quiz_request, "error")
+                return index, {"error": f"Quiz generation failed: {str(e)}"}
+
+    tasks = [asyncio.ensure_future(run_one(i, r)) for i, r in enumerate(quiz_requests)]
+
+    if format == "zip":
+        results = await asyncio.gather(*tasks)
+        archive = await run_in_threadpool(build_quiz_zip, results)
+        return Response(
+            content=archive,
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="quizzes.zip"'}
+        )
+
+    async def result_stream():
+        try:
+            for finished in asyncio.as_completed(tasks):
+                index, item = await finished
+                line = {"index": index, "topic": quiz_requests[index].topic[:80]}
+                if "error" in item:
+                    line["error"] = item["error"]
+                else:
+                    line.update(quiz_response(item["quiz_id"], item["entry"], item["cached"]))
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            # Client went away: stop the remaining generations
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+def accepts_gzip(accept_encoding):
+    """True if an Accept-Encoding header allows gzip, honouring q-values ("gzip;q=0" refuses it)"""
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+    q = weights.get("gzip", weights.get("x-gzip", weights.get("*", 0.0)))
+    return q > 0
+
+@app.get("/quiz/{quiz_id}/{variant}.pdf")
+def download_quiz_pdf(quiz_id: str, variant: str, request: Request):
+    """Serve a stored quiz PDF with ETag revalidation and gzip when accepted"""
+    if variant not in QUIZ_PDF_VARIANTS:
+        raise HTTPException(status_code=404, detail="Unknown PDF variant")
+    entry = quiz_cache.get(quiz_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Quiz not found or expired, please generate it again")
+
+    use_gzip = accepts_gzip(request.headers.get("accept-encoding", ""))
+    etag = entry["etags"][variant]
+    if use_gzip:
+        # Each representation needs its own strong ETag
+        etag = etag[:-1] + '-gz"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, max-age=3600",
+        "Content-Disposition": f'attachment; filename="quiz_{variant}.pdf"',
+        "Vary": "Accept-Encoding"
+    }
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    body = entry["pdfs"][variant]
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+    else:
+        body = gzip.decompress(body)
+    return Response(content=body, media_type="application/pdf", headers=headers)
+
+@app.get("/stats")
+def stats_endpoint() -> Dict[str, Any]:
+    """Report reuse counters for pooled agents and LLM clients"""
+    return {
+        "agents": agent_registry.stats(),
+        "response_cache": dict(response_cache.stats(), enabled=RESPONSE_CACHE_ENABLED),
+        "quiz_cache": quiz_cache.stats(),
+        "sessions": session_store.stats(),
+        "tokens": token_ledger.stats(),
+        "routing": router.stats(),
+        "single_flight": single_flight.stats(),
+        "search_cache": search_cache.stats(),
+        "scheduler": scheduler.stats(),
+        "cassette": cassette.stats(),
+        "question_bank": question_bank.stats()
+    }
+
+@app.get("/ready")
+def ready_endpoint():
+    """Readiness probe: 503 until the startup warm-up has finished"""
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition of request counts, stage latencies and payload sizes"""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+# Step3: Run app & Explore Swagger UI Docs
+if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=9999)
\ No newline at end of file
@@ -0,0 +1,324 @@
+"""Offline load test for the FastAPI backend.
+
+Boots backend.app in-process with a deterministic fake chat model in place
+of ChatGroq/ChatOpenAI, so no API credit is spent, drives /chat and
+/generate_quiz at a given concurrency and prints the results as JSON.
+
+    python benchmark.py --requests 200 --concurrency 20 --latency 0.5 --output bench.json
+    python benchmark.py --baseline bench.json   # exit 1 if p95 or rps regressed
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGES = ("agent_build", "llm_call", "tool_call", "json_extract", "pdf_render")
+
+VOCABULARY = (
+    "photosynthesis energy light plants cells water carbon oxygen glucose leaves "
+    "chlorophyll roots growth sunlight process reaction molecules nutrients soil climate"
+).split()
+
+
+def fake_words(seed, count):
+    """Deterministic filler text: the same prompt always gets the same answer"""
+    digest = hashlib.sha256(seed.encode("utf-8")).digest()
+    return [VOCABULARY[digest[i % len(digest)] % len(VOCABULARY)] for i in range(count)]
+
+
+def fake_quiz(seed, count=10):
+    words = fake_words(seed, count)
+    questions = []
+    for i in range(count):
+        # Four distinct options, duplicates would fail quiz validation
+        start = VOCABULARY.index(words[i])
+        options = [VOCABULARY[(start + k) % len(VOCABULARY)] for k in range(4)]
+        questions.append({
+            "question": f"Question {i + 1} about {words[i]}?",
+            "options": [f"{label}) {option}" for label, option in zip("ABCD", options)],
+            "answer": "ABCD"[i % 4],
+            "explanation": f"Because of {options[0]} and {options[1]}."
+        })
+    return json.dumps(questions)
+
+
+def make_fake_chat_model(latency, token_latency, completion_tokens):
+    """Build a LangChain chat model class with fixed timing and output"""
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+    class BenchmarkChatModel(BaseChatModel):
+        model: str = "benchmark"
+
+        @property
+        def _llm_type(self):
+            return "benchmark"
+
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+        def _reply(self, messages):
+            prompt = "\n".join(str(m.content) for m in messages)
+            # The quiz endpoints ask for a JSON array in their system prompt
+            if "quiz" in str(messages[0].content).lower():
+                return fake_quiz(prompt)
+            return " ".join(fake_words(prompt, completion_tokens))
+
+        def _usage(self, messages, reply):
+            prompt_tokens = sum(len(str(m.content).split()) for m in messages)
+            output_tokens = len(reply.split())
+            return {"input_tokens": prompt_tokens, "output_tokens": output_tokens, "total_tokens": prompt_tokens + output_tokens}
+
+        def _duration(self, reply):
+            return latency + token_latency * len(reply.split())
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            reply = self._reply(messages)
+            time.sleep(self._duration(reply))
+            message = AIMessage(content=reply, usage_metadata=self._usage(messages, reply))
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            reply = self._reply(messages)
+            await asyncio.sleep(self._duration(reply))
+            message = AIMessage(content=reply, usage_metadata=self._usage(messages, reply))
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            reply = self._reply(messages)
+            await asyncio.sleep(latency)
+            words = reply.split(" ")
+            for index, word in enumerate(words):
+                if token_latency:
+                    await asyncio.sleep(token_latency)
+                last = index == len(words) - 1
+                chunk = ChatGenerationChunk(message=AIMessageChunk(
+                    content=word if last else word + " ",
+                    usage_metadata=self._usage(messages, reply) if last else None
+                ))
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+
+    return BenchmarkChatModel
+
+
+def load_app(args):
+    """Import the backend with fake providers"""
+    # Questions banked by an earlier run would skip LLM calls and skew the comparison
+    os.environ["QUESTION_BANK_ENABLED"] = "true" if args.question_bank else "false"
+    if args.question_bank:
+        os.environ["QUESTION_BANK_PATH"] = os.path.join(tempfile.mkdtemp(prefix="edugen-bench-"), "question_bank.sqlite3")
+    import ai_agent
+    model_class = make_fake_chat_model(args.latency, args.token_latency, args.completion_tokens)
+    for provider in list(ai_agent.PROVIDER_FACTORIES):
+        ai_agent.PROVIDER_FACTORIES[provider] = lambda llm_id: model_class(model=llm_id)
+    import backend
+    return backend
+
+
+def chat_payload(args, index):
+    message = "Explain photosynthesis" if args.shared_prompts else f"Explain photosynthesis (request {index})"
+    return {
+        "model_name": args.model,
+        "model_provider": args.provider,
+        "system_prompt": "Act as an AI chatbot who is smart and friendly",
+        "messages": [message],
+        "allow_search": False,
+        "language": args.language
+    }
+
+
+def quiz_payload(args, index):
+    topic = "Photosynthesis" if args.shared_prompts else f"Photosynthesis part {index}"
+    return {"topic": topic, "language": args.language, "model_name": args.model, "model_provider": args.provider}
+
+
+SCENARIOS = {
+    "chat": ("/chat", chat_payload),
+    "quiz": ("/generate_quiz", quiz_payload),
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def max_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def stage_totals():
+    from metrics import stage_seconds
+    return {stage: stage_seconds.snapshot(stage=stage) for stage in STAGES}
+
+
+async def run_scenario(client, name, args):
+    path, make_payload = SCENARIOS[name]
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for index in range(args.requests):
+        queue.put_nowait(index)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            index = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.post(path, json=make_payload(args, index))
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200 or "error" in response.json():
+                errors += 1
+
+    # Warm the agent registry so the first requests are not all cold builds
+    for index in range(args.warmup):
+        await client.post(path, json=make_payload(args, -1 - index))
+
+    stages_before = stage_totals()
+    rss_before = max_rss_mb()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(args.concurrency, args.requests))))
+    wall = time.perf_counter() - started
+    stages_after = stage_totals()
+
+    latencies.sort()
+    stages = {
+        stage: {
+            "count": stages_after[stage]["count"] - stages_before[stage]["count"],
+            "seconds": stages_after[stage]["sum"] - stages_before[stage]["sum"]
+        }
+        for stage in STAGES
+    }
+    busy = sum(latencies)
+    return {
+        "endpoint": path,
+        "requests": len(latencies),
+        "errors": errors,
+        "concurrency": args.concurrency,
+        "wall_seconds": wall,
+        "rps": len(latencies) / wall if wall else None,
+        "latency_seconds": {
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else None,
+            "mean": busy / len(latencies) if latencies else None
+        },
+        "stages": stages,
+        # Share of summed request time spent building PDFs
+        "pdf_render_share": stages["pdf_render"]["seconds"] / busy if busy else 0.0,
+        "max_rss_mb": {"before": rss_before, "after": max_rss_mb()}
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(args):
+    import httpx
+    backend = load_app(args)
+    transport = httpx.ASGITransport(app=backend.app)
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        for name in args.scenarios:
+            results[name] = await run_scenario(client, name, args)
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            key: getattr(args, key)
+            for key in ("requests", "concurrency", "latency", "token_latency", "completion_tokens",
+                        "model", "provider", "language", "shared_prompts", "warmup", "question_bank")
+        },
+        "scenarios": results
+    }
+
+
+def compare(report, baseline, max_regression):
+    """Return human-readable regressions of p95 latency and throughput against a baseline"""
+    regressions = []
+    for name, result in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        old_p95, new_p95 = previous["latency_seconds"]["p95"], result["latency_seconds"]["p95"]
+        if old_p95 and new_p95 > old_p95 * (1 + max_regression):
+            regressions.append(f"{name}: p95 {old_p95:.3f}s -> {new_p95:.3f}s")
+        if previous["rps"] and result["rps"] < previous["rps"] * (1 - max_regression):
+            regressions.append(f"{name}: rps {previous['rps']:.1f} -> {result['rps']:.1f}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the EduGen backend")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=["chat", "quiz"])
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake model time to first token (s)")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="fake model time per output token (s)")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="fake chat answer length in words")
+    parser.add_argument("--model", default="llama-3.3-70b-versatile")
+    parser.add_argument("--provider", default="Groq")
+    parser.add_argument("--language", default="English")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed requests before each scenario")
+    parser.add_argument("--shared-prompts", action="store_true",
+                        help="send the same prompt every time to measure caching and coalescing")
+    parser.add_argument("--question-bank", action="store_true",
+                        help="serve quizzes from a question bank in a fresh temporary database")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="allowed fractional p95/rps regression against --baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run_benchmark(args))
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
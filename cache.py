@@ -0,0 +1,433 @@
+import abc
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# "memory" keeps each cache inside the worker process; "sqlite" stores them in
+# one WAL-mode database file shared by every worker on the machine
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory").lower()
+CACHE_SQLITE_PATH = os.environ.get("CACHE_SQLITE_PATH", "edugen_cache.sqlite3")
+# A read only refreshes an entry's LRU position when it is older than this,
+# so hot keys don't turn every read into a write
+CACHE_SQLITE_TOUCH_INTERVAL = float(os.environ.get("CACHE_SQLITE_TOUCH_INTERVAL", "60"))
+
+SQLITE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS cache_entries ("
+    "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL, "
+    "expires_at REAL NOT NULL, stale_until REAL NOT NULL, last_access REAL NOT NULL, "
+    "PRIMARY KEY (namespace, key)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS cache_entries_lru ON cache_entries (namespace, last_access)",
+    # Running size per namespace, kept by triggers so eviction never rescans
+    "CREATE TABLE IF NOT EXISTS cache_namespaces ("
+    "namespace TEXT PRIMARY KEY, bytes INTEGER NOT NULL, entries INTEGER NOT NULL)",
+    "CREATE TRIGGER IF NOT EXISTS cache_entries_ai AFTER INSERT ON cache_entries BEGIN "
+    "INSERT INTO cache_namespaces VALUES (new.namespace, new.size, 1) "
+    "ON CONFLICT (namespace) DO UPDATE SET bytes = bytes + new.size, entries = entries + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS cache_entries_ad AFTER DELETE ON cache_entries BEGIN "
+    "UPDATE cache_namespaces SET bytes = bytes - old.size, entries = entries - 1 "
+    "WHERE namespace = old.namespace; END",
+    "CREATE TRIGGER IF NOT EXISTS cache_entries_au AFTER UPDATE OF size ON cache_entries BEGIN "
+    "UPDATE cache_namespaces SET bytes = bytes + new.size - old.size WHERE namespace = new.namespace; END",
+)
+
+
+def normalize_text(text):
+    """Collapse whitespace and case so trivially different inputs share a key"""
+    return re.sub(r"\s+", " ", str(text)).strip().casefold()
+
+
+def make_key(*parts):
+    """Build a stable hex digest from JSON-serializable key parts"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def estimate_size(value):
+    """Rough in-memory size of a cached value in bytes"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, dict):
+        return sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class CacheBackend(abc.ABC):
+    """Interface shared by the cache implementations.
+
+    Keys are strings (see make_key). Every entry has a TTL and an optional
+    ``stale_ttl`` during which ``get_with_staleness`` still returns it, which
+    lets callers serve a stale value while they refresh it. Each backend is
+    bounded by total bytes and optionally entry count, evicting least
+    recently used entries first. ``update`` is an atomic read-modify-write,
+    also across processes for a shared backend.
+
+    Async code uses the ``a*`` methods: backends that may wait on disk or
+    locks (``blocking``) run them on a worker thread, the others inline.
+    """
+
+    blocking = False
+
+    async def _run(self, func, *args, **kwargs):
+        if self.blocking:
+            return await asyncio.to_thread(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    async def aget(self, key):
+        return await self._run(self.get, key)
+
+    async def aget_with_staleness(self, key):
+        return await self._run(self.get_with_staleness, key)
+
+    async def aset(self, key, value, ttl=None, stale_ttl=0):
+        return await self._run(self.set, key, value, ttl=ttl, stale_ttl=stale_ttl)
+
+    async def aupdate(self, key, func, ttl=None, stale_ttl=0):
+        return await self._run(self.update, key, func, ttl=ttl, stale_ttl=stale_ttl)
+
+    async def adelete(self, key):
+        return await self._run(self.delete, key)
+
+    @abc.abstractmethod
+    def get(self, key):
+        """Return a fresh value or None"""
+
+    @abc.abstractmethod
+    def get_with_staleness(self, key):
+        """Return (value, is_stale) for a fresh or stale entry, or None"""
+
+    @abc.abstractmethod
+    def set(self, key, value, ttl=None, stale_ttl=0):
+        pass
+
+    @abc.abstractmethod
+    def update(self, key, func, ttl=None, stale_ttl=0):
+        """Store func(fresh value or None) as the new value, atomically; returns it"""
+
+    @abc.abstractmethod
+    def delete(self, key):
+        pass
+
+    @abc.abstractmethod
+    def clear(self):
+        pass
+
+    @abc.abstractmethod
+    def stats(self):
+        pass
+
+
+class TTLCache(CacheBackend):
+    """Thread-safe in-process LRU cache with a per-entry TTL and a total byte budget"""
+
+    def __init__(self, ttl=3600, max_bytes=32 * 1024 * 1024, max_entries=None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # Reentrant so update can get and set under one hold
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at, stale_until = entry
+            now = time.monotonic()
+            if expires_at <= now:
+                if stale_until <= now:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_with_staleness(self, key):
+        """Return (value, is_stale) for a fresh or stale entry, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at, stale_until = entry
+            now = time.monotonic()
+            if stale_until <= now:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if expires_at <= now:
+                self.stale_hits += 1
+                return value, True
+            self.hits += 1
+            return value, False
+
+    def set(self, key, value, ttl=None, stale_ttl=0):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            # Never let one oversized value flush the whole cache
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at, expires_at + stale_ttl)
+            self._bytes += size
+            while self._entries and (
+                self._bytes > self.max_bytes
+                or (self.max_entries is not None and len(self._entries) > self.max_entries)
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def update(self, key, func, ttl=None, stale_ttl=0):
+        with self._lock:
+            value = func(self.get(key))
+            self.set(key, value, ttl=ttl, stale_ttl=stale_ttl)
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        size = self._entries.pop(key)[1]
+        self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            }
+
+
+class SQLiteCache(CacheBackend):
+    """Cache stored in a SQLite database in WAL mode, shared across processes.
+
+    Every worker that opens the same file sees the same entries, so hit
+    rates do not drop with the worker count. Caches are separated by
+    ``namespace`` and each namespace is bounded on its own. Values are
+    pickled, so the file must only be writable by the application. Expiry
+    uses wall-clock time because it is compared across processes.
+    """
+
+    blocking = True
+
+    def __init__(self, path=CACHE_SQLITE_PATH, namespace="default", ttl=3600, max_bytes=32 * 1024 * 1024, max_entries=None):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect(self):
+        # sqlite3 connections must not be shared across threads or forks
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                new_totals = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'cache_namespaces'"
+                ).fetchone() is None
+                for statement in SQLITE_SCHEMA:
+                    conn.execute(statement)
+                if new_totals:
+                    # A database from before the totals table: count what is there once
+                    conn.execute(
+                        "INSERT INTO cache_namespaces "
+                        "SELECT namespace, SUM(size), COUNT(*) FROM cache_entries GROUP BY namespace"
+                    )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        # Take the write lock up front so concurrent writers queue instead of failing
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _lookup(self, key, allow_stale):
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, expires_at, stale_until, last_access FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key)
+        ).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        value, expires_at, stale_until, last_access = row
+        now = time.time()
+        if stale_until <= now:
+            self.delete(key)
+            self._count("misses")
+            return None
+        stale = expires_at <= now
+        if stale and not allow_stale:
+            self._count("misses")
+            return None
+        if now - last_access >= CACHE_SQLITE_TOUCH_INTERVAL:
+            conn.execute(
+                "UPDATE cache_entries SET last_access = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key)
+            )
+        self._count("stale_hits" if stale else "hits")
+        return pickle.loads(value), stale
+
+    def get(self, key):
+        hit = self._lookup(key, allow_stale=False)
+        return None if hit is None else hit[0]
+
+    def get_with_staleness(self, key):
+        return self._lookup(key, allow_stale=True)
+
+    def set(self, key, value, ttl=None, stale_ttl=0):
+        with self._transaction() as conn:
+            self._write(conn, key, value, ttl, stale_ttl)
+
+    def update(self, key, func, ttl=None, stale_ttl=0):
+        # The write lock is held from the read to the write, other workers wait
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+            fresh = row is not None and row[1] > time.time()
+            self._count("hits" if fresh else "misses")
+            value = func(pickle.loads(row[0]) if fresh else None)
+            self._write(conn, key, value, ttl, stale_ttl)
+        return value
+
+    def _write(self, conn, key, value, ttl, stale_ttl):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            # Never let one oversized value flush the whole cache
+            return
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        # An upsert rather than REPLACE, so the size triggers see the change
+        conn.execute(
+            "INSERT INTO cache_entries VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+            "expires_at = excluded.expires_at, stale_until = excluded.stale_until, "
+            "last_access = excluded.last_access",
+            (self.namespace, key, blob, len(blob), expires_at, expires_at + stale_ttl, now)
+        )
+        self._evict(conn)
+
+    def _totals(self, conn):
+        row = conn.execute(
+            "SELECT bytes, entries FROM cache_namespaces WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        return row or (0, 0)
+
+    def _over_budget(self, total, count):
+        return total > self.max_bytes or (self.max_entries is not None and count > self.max_entries)
+
+    def _evict(self, conn):
+        total, count = self._totals(conn)
+        if not self._over_budget(total, count):
+            return
+        victims = []
+        rows = conn.execute(
+            "SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY last_access", (self.namespace,)
+        )
+        for key, size in rows:
+            if not self._over_budget(total, count):
+                break
+            victims.append((self.namespace, key))
+            total -= size
+            count -= 1
+        if victims:
+            conn.executemany("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", victims)
+            self._count("evictions", len(victims))
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+
+    def stats(self):
+        size, entries = self._totals(self._connect())
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "backend": "sqlite",
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                # Counters are this worker's own lookups
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            }
+
+
+def make_cache(namespace, ttl=3600, max_bytes=32 * 1024 * 1024, max_entries=None):
+    """Build a cache on the configured CACHE_BACKEND"""
+    if CACHE_BACKEND == "sqlite":
+        return SQLiteCache(CACHE_SQLITE_PATH, namespace, ttl=ttl, max_bytes=max_bytes, max_entries=max_entries)
+    if CACHE_BACKEND != "memory":
+        raise ValueError(f"CACHE_BACKEND must be memory or sqlite, got {CACHE_BACKEND!r}")
+    return TTLCache(ttl=ttl, max_bytes=max_bytes, max_entries=max_entries)
@@ -0,0 +1,140 @@
+import asyncio
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+# off: call providers normally; record: call them and save every exchange;
+# replay: serve saved exchanges only, no network needed
+CASSETTE_MODE = os.environ.get("LLM_CASSETTE_MODE", "off").lower()
+CASSETTE_PATH = os.environ.get("LLM_CASSETTE_PATH", "llm_cassette.jsonl.gz")
+# Multiplies recorded latencies on replay: 1 keeps the original timing, 0 serves instantly
+CASSETTE_TIME_SCALE = float(os.environ.get("LLM_CASSETTE_TIME_SCALE", "1.0"))
+
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode for a request that was never recorded"""
+
+    def __str__(self):
+        kind, key = self.args
+        return f"No recorded {kind} exchange for fingerprint {key[:12]}"
+
+
+class Cassette:
+    """Record and replay provider exchanges keyed by request fingerprint.
+
+    Each exchange is one JSON line in a gzip file: its kind ("agent",
+    "agent_stream" or "search"), the fingerprint, the response and the
+    observed latency. Streams store every event with its offset from the
+    start so replay reproduces token timing. A fingerprint recorded more
+    than once is replayed round-robin.
+    """
+
+    def __init__(self, path=CASSETTE_PATH, mode=CASSETTE_MODE, time_scale=CASSETTE_TIME_SCALE):
+        if mode not in ("off", "record", "replay"):
+            raise ValueError(f"LLM_CASSETTE_MODE must be off, record or replay, got {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.time_scale = time_scale
+        self._lock = threading.Lock()
+        self._file = None
+        self._exchanges = None
+        self._positions = defaultdict(int)
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+
+    @property
+    def recording(self):
+        return self.mode == "record"
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def record(self, kind, key, response, latency):
+        line = json.dumps({"kind": kind, "key": key, "latency": round(latency, 4), "response": response},
+                          ensure_ascii=False, separators=(",", ":"), default=str)
+        with self._lock:
+            if self._file is None:
+                self._file = gzip.open(self.path, "at", encoding="utf-8")
+                atexit.register(self.close)
+            self._file.write(line + "\n")
+            # Sync-flush so a crash keeps everything recorded so far readable
+            self._file.flush()
+            self.recorded += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _load(self):
+        exchanges = defaultdict(list)
+        if os.path.exists(self.path):
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    exchanges[(entry["kind"], entry["key"])].append((entry["response"], entry["latency"]))
+        return exchanges
+
+    def lookup(self, kind, key):
+        """Return (response, scaled latency) of the next recording for a fingerprint"""
+        with self._lock:
+            if self._exchanges is None:
+                self._exchanges = self._load()
+            recordings = self._exchanges.get((kind, key))
+            if not recordings:
+                self.misses += 1
+                raise CassetteMiss(kind, key)
+            position = self._positions[(kind, key)]
+            self._positions[(kind, key)] = position + 1
+            self.replayed += 1
+        response, latency = recordings[position % len(recordings)]
+        return response, latency * self.time_scale
+
+    def replay(self, kind, key):
+        response, delay = self.lookup(kind, key)
+        time.sleep(delay)
+        return response
+
+    async def areplay(self, kind, key):
+        response, delay = self.lookup(kind, key)
+        await asyncio.sleep(delay)
+        return response
+
+    async def record_stream(self, kind, key, events):
+        """Pass an async stream of JSON-serializable events through, saving it once complete"""
+        started = time.perf_counter()
+        recorded = []
+        async for event in events:
+            # Consumers may modify the event after it is yielded, keep our own copy
+            recorded.append([round(time.perf_counter() - started, 4), dict(event)])
+            yield event
+        self.record(kind, key, recorded, time.perf_counter() - started)
+
+    async def replay_stream(self, kind, key):
+        recorded, _ = self.lookup(kind, key)
+        started = time.perf_counter()
+        for offset, event in recorded:
+            delay = started + offset * self.time_scale - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield dict(event)
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "path": self.path,
+            "time_scale": self.time_scale,
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "misses": self.misses,
+        }
+
+
+cassette = Cassette()
@@ -7,12 +7,14 @@ import platform
 import requests
 import streamlit as st
 import speech_recognition as sr
+import tempfile
 from io import BytesIO
 from pydub import AudioSegment
 from elevenlabs.client import ElevenLabs
+from tts_cache import tts_cache
+from speech_stream import SpeechPipeline
 import uuid
 import json
-import base64
 import time
 from datetime import datetime
 
@@ -26,6 +28,15 @@ VOICE_IDS = {
     "Aria": "EXAVITQu4vr4xnSDxMaL"
 }
 
+# Hint prepended to the text so ElevenLabs picks the right accent
+PRONUNCIATION_PREFIXES = {
+    "hi-IN": "(Hindi pronunciation)",
+    "ta-IN": "(Tamil pronunciation)",
+    "mr-IN": "(Marathi pronunciation)",
+    "bn-IN": "(Bengali pronunciation)"
+}
+TTS_OUTPUT_FORMAT = "mp3_22050_32"
+
 # ========== Helper Functions ==========
 def record_audio(timeout=10):
     """Record audio from microphone"""
@@ -51,58 +62,148 @@ def record_audio(timeout=10):
             st.error(f"❌ Speech recognition error: {e}")
             return ""
 
-def speak_response_with_elevenlabs(text):
-    """Generate speech from text using ElevenLabs"""
-    try:
-        unique_id = uuid.uuid4().hex
-        output_path = f"response_{unique_id}.mp3"
-        
-        client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
-        
-        model_id = "eleven_multilingual_v2" if st.session_state["language"] != "en-US" else "eleven_turbo_v2"
-        
-        pronunciation_text = text
-        if st.session_state["language"] == "hi-IN":
-            pronunciation_text = f"(Hindi pronunciation){text}"
-        elif st.session_state["language"] == "ta-IN":
-            pronunciation_text = f"(Tamil pronunciation){text}"
-        elif st.session_state["language"] == "mr-IN":
-            pronunciation_text = f"(Marathi pronunciation){text}"
-        elif st.session_state["language"] == "bn-IN":
-            pronunciation_text = f"(Bengali pronunciation){text}"
-        
-        # Get voice ID from name
-        voice_name = st.session_state["voice"]
-        voice_id = VOICE_IDS.get(voice_name, VOICE_IDS["Rachel"])  # Fallback to Rachel
-        
-        # Generate audio with the new SDK syntax
-        audio = client.text_to_speech.convert(
-            voice_id=voice_id,
-            model_id=model_id,
-            text=pronunciation_text,
-            output_format="mp3_22050_32"
-        )
-        
-        # Save audio chunks to file
-        with open(output_path, "wb") as f:
-            for chunk in audio:
-                if chunk:
-                    f.write(chunk)
-        
-        st.session_state["last_audio_path"] = output_path
-        st.session_state["last_response"] = text
-        
-        # Display audio player
-        audio_file = open(output_path, "rb")
+def tts_settings():
+    """(model_id, voice_id, pronunciation prefix) for the selected language and voice"""
+    model_id = "eleven_multilingual_v2" if st.session_state["language"] != "en-US" else "eleven_turbo_v2"
+    prefix = PRONUNCIATION_PREFIXES.get(st.session_state["language"], "")
+    
+    # Get voice ID from name
+    voice_name = st.session_state["voice"]
+    voice_id = VOICE_IDS.get(voice_name, VOICE_IDS["Rachel"])  # Fallback to Rachel
+    return model_id, voice_id, prefix
+
+def play_response_audio(output_path, text):
+    st.session_state["last_audio_path"] = output_path
+    st.session_state["last_response"] = text
+    
+    # Display audio player
+    with open(output_path, "rb") as audio_file:
         audio_bytes = audio_file.read()
-        st.audio(audio_bytes, format="audio/mp3")
+    st.audio(audio_bytes, format="audio/mp3")
+
+@st.cache_resource
+def elevenlabs_client():
+    """One ElevenLabs client, and so one connection pool, shared by every answer"""
+    return ElevenLabs(api_key=ELEVENLABS_API_KEY)
+
+def start_speech_pipeline():
+    """Synthesize the answer sentence by sentence in the background while it streams in"""
+    model_id, voice_id, prefix = tts_settings()
+    client = elevenlabs_client()
+    state = {"first": True}
+    
+    def synthesize_sentence(sentence):
+        # The pronunciation hint goes out once per answer, with its first sentence
+        sentence_prefix = prefix if state["first"] else ""
+        state["first"] = False
         
+        def synthesize():
+            return client.text_to_speech.convert(
+                voice_id=voice_id,
+                model_id=model_id,
+                text=sentence_prefix + sentence,
+                output_format=TTS_OUTPUT_FORMAT
+            )
+        return tts_cache.stream(synthesize, sentence, voice_id, model_id, TTS_OUTPUT_FORMAT, sentence_prefix)
+    
+    return SpeechPipeline(synthesize_sentence)
+
+def finish_speech_pipeline(speech, text):
+    """Wait for the last sentences, then play the audio of the whole answer"""
+    try:
+        speech.close()
+        # MP3 frames concatenate cleanly, the sentence audio plays as one file.
+        # The sentences are cached already, the joined audio goes to a temporary file.
+        with tempfile.NamedTemporaryFile(prefix="response_", suffix=".mp3", delete=False) as f:
+            for chunk in speech.chunks():
+                f.write(chunk)
+        output_path = f.name
+        play_response_audio(output_path, text)
         return output_path
-        
+    
     except Exception as e:
         st.error(f"❌ TTS Error: {e}")
         return None
 
+def stream_sse(api_url, payload):
+    """Yield (event, data) pairs from the backend's server-sent event stream"""
+    with requests.post(api_url, json=payload, stream=True, timeout=(5, 300)) as response:
+        if response.status_code != 200:
+            yield "error", {"error": f"Failed to connect to AI service. Status: {response.status_code}"}
+            return
+        # SSE is always UTF-8, don't let requests guess the charset
+        response.encoding = "utf-8"
+        event, data_lines = "message", []
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data_lines.append(line[len("data:"):].strip())
+            elif not line and data_lines:
+                yield event, json.loads("\n".join(data_lines))
+                event, data_lines = "message", []
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def fetch_quiz_pdf(url):
+    """Download a quiz PDF once; the URL carries the version so it is safe to cache"""
+    response = requests.get(f"{BACKEND_URL}{url}", timeout=30)
+    response.raise_for_status()
+    return response.content
+
+def render_quiz_question(idx, item):
+    st.markdown(f"""
+    <div class="glass-card">
+        <h4>Question {idx + 1}</h4>
+        <p><strong>{item.get('question', '')}</strong></p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    options = item.get('options', [])
+    for i, option in enumerate(options):
+        st.markdown(f"**{chr(65+i)}.** {option}")
+    
+    st.markdown(f"""
+    <div class="info-box">
+        <strong>Answer:</strong> {item.get('answer', '')}<br>
+        <strong>Explanation:</strong> {item.get('explanation', '')}
+    </div>
+    """, unsafe_allow_html=True)
+
+def render_quiz_downloads(quiz_data):
+    st.markdown("#### 📥 Download Options")
+    
+    # Download buttons, PDF bytes are fetched on first render and cached
+    try:
+        st.download_button(
+            label="📋 Quiz with Answers",
+            data=fetch_quiz_pdf(quiz_data["quiz_with_answers_url"]),
+            file_name="quiz_with_answers.pdf",
+            mime="application/pdf",
+            key="download_answers"
+        )
+        
+        st.download_button(
+            label="❓ Quiz Questions Only",
+            data=fetch_quiz_pdf(quiz_data["quiz_questions_url"]),
+            file_name="quiz_questions.pdf",
+            mime="application/pdf",
+            key="download_questions"
+        )
+    except requests.RequestException as e:
+        st.markdown(f"""
+        <div class="status-error">
+            ❌ Could not load quiz PDFs: {e}
+        </div>
+        """, unsafe_allow_html=True)
+
+def render_bot_message(placeholder, text):
+    placeholder.markdown(f"""
+    <div class="bot-message">
+        <strong>🎯 Response:</strong><br>
+        {text}
+    </div>
+    """, unsafe_allow_html=True)
+
 # Initialize session state
 if "user_query" not in st.session_state:
     st.session_state["user_query"] = ""
@@ -120,10 +221,16 @@ if "quiz_data" not in st.session_state:
     st.session_state.quiz_data = None
 if "show_convai" not in st.session_state:
     st.session_state.show_convai = False
+if "session_id" not in st.session_state:
+    # The backend keeps this conversation's history under this ID
+    st.session_state["session_id"] = uuid.uuid4().hex
 
 # ========== ElevenLabs Setup ==========
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 
+# ========== Backend Setup ==========
+BACKEND_URL = "http://127.0.0.1:9999"
+
 # ========== Custom CSS for Professional Look ==========
 def load_custom_css():
     st.markdown("""
@@ -502,6 +609,16 @@ with st.sidebar:
     # ConvAI Widget Toggle
     st.markdown("#### 🔊 ElevenLabs ConvAI")
     st.session_state.show_convai = st.checkbox("🎤 Enable Voice Conversation", value=st.session_state.show_convai)
+    
+    # Conversation Memory
+    st.markdown("#### 🧠 Conversation Memory")
+    if st.button("🧹 Start New Conversation", key="new_conversation"):
+        try:
+            requests.delete(f"{BACKEND_URL}/sessions/{st.session_state['session_id']}", timeout=5)
+        except requests.RequestException:
+            pass  # The backend evicts idle sessions on its own
+        st.session_state["session_id"] = uuid.uuid4().hex
+        st.session_state["chat_history"] = []
 
 # ========== Main Content Area ==========
 # System Prompt Configuration
@@ -573,7 +690,7 @@ if st.button("🚀 Send Message", key="send_message", type="primary"):
     
     if user_query and user_query.strip():
         # API Configuration
-        API_URL = "http://127.0.0.1:9999/chat"
+        API_URL = "http://127.0.0.1:9999/chat/stream"
         
         payload = {
             "model_name": selected_model,
@@ -581,50 +698,53 @@ if st.button("🚀 Send Message", key="send_message", type="primary"):
             "system_prompt": system_prompt,
             "messages": [user_query],
             "allow_search": allow_web_search,
-            "language": st.session_state["language"]
+            "language": st.session_state["language"],
+            "session_id": st.session_state["session_id"]
         }
         
-        with st.spinner("🤖 Processing your request..."):
-            progress_bar = st.progress(0)
-            for i in range(100):
-                time.sleep(0.01)
-                progress_bar.progress(i + 1)
-            
-            response = requests.post(API_URL, json=payload)
+        # Render tokens as they arrive instead of waiting for the full answer
+        st.markdown("### 🤖 AI Response")
+        tool_placeholder = st.empty()
+        response_placeholder = st.empty()
+        response_text = ""
+        error_text = None
+        # Voice is synthesized while the answer is still being written
+        speech = start_speech_pipeline() if use_tts else None
         
-        if response.status_code == 200:
-            response_data = response.json()
-            
-            # Handle response format
-            if isinstance(response_data, dict):
-                if "error" in response_data:
-                    st.markdown(f"""
-                    <div class="status-error">
-                        ❌ Error: {response_data["error"]}
-                    </div>
-                    """, unsafe_allow_html=True)
-                    response_text = response_data["error"]
-                elif "response" in response_data:
-                    response_text = response_data["response"]
-                else:
-                    response_text = str(response_data)
-            else:
-                response_text = str(response_data)
-            
-            # Display response
-            st.markdown("### 🤖 AI Response")
-            st.markdown(f"""
-            <div class="bot-message">
-                <strong>🎯 Response:</strong><br>
-                {response_text}
-            </div>
-            """, unsafe_allow_html=True)
+        try:
+            with st.spinner("🤖 Processing your request..."):
+                for event, data in stream_sse(API_URL, payload):
+                    if event == "token":
+                        response_text += data["content"]
+                        render_bot_message(response_placeholder, response_text + " ▌")
+                        if speech is not None:
+                            speech.feed(data["content"])
+                    elif event == "tool_start":
+                        # Text before a tool call is the model thinking, not the answer
+                        response_text = ""
+                        if speech is not None:
+                            speech.cancel()
+                            speech = start_speech_pipeline()
+                        tool_placeholder.info(f"🔍 Using {data['name']}...")
+                    elif event == "tool_end":
+                        tool_placeholder.empty()
+                    elif event == "done":
+                        response_text = data["response"]
+                    elif event == "error":
+                        error_text = data["error"]
+        except requests.RequestException as e:
+            error_text = f"Failed to connect to AI service: {e}"
+        
+        tool_placeholder.empty()
+        
+        if error_text is None:
+            render_bot_message(response_placeholder, response_text)
             
             # Handle TTS if enabled
             audio_path = None
             if use_tts:
                 with st.spinner("🔊 Generating voice response..."):
-                    audio_path = speak_response_with_elevenlabs(response_text)
+                    audio_path = finish_speech_pipeline(speech, response_text)
             
             # Add to chat history
             chat_entry = {
@@ -647,9 +767,12 @@ if st.button("🚀 Send Message", key="send_message", type="primary"):
             """, unsafe_allow_html=True)
             
         else:
+            if speech is not None:
+                speech.cancel()
+            response_placeholder.empty()
             st.markdown(f"""
             <div class="status-error">
-                ❌ Failed to connect to AI service. Status: {response.status_code}
+                ❌ Error: {error_text}
             </div>
             """, unsafe_allow_html=True)
     else:
@@ -675,79 +798,71 @@ if st.session_state.get("last_response"):
     quiz_col1, quiz_col2 = st.columns([2, 1])
     
     with quiz_col1:
-        if st.button("📝 Generate Quiz", key="generate_quiz"):
-            QUIZ_URL = "http://127.0.0.1:9999/generate_quiz"
-            
-            with st.spinner("🧠 Creating your personalized quiz..."):
-                payload = {
-                    "topic": st.session_state["last_response"],
-                    "language": st.session_state["language"],
-                    "model_name": selected_model,
-                    "model_provider": provider
-                }
-                
-                quiz_response = requests.post(QUIZ_URL, json=payload)
-                
-                if quiz_response.status_code == 200:
-                    quiz_data = quiz_response.json()
-                    st.session_state.quiz_data = quiz_data
-                    
-                    st.markdown("""
-                    <div class="status-success">
-                        ✅ Quiz generated successfully! Download options available below.
-                    </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    st.markdown(f"""
-                    <div class="status-error">
-                        ❌ Quiz generation failed: {quiz_response.text}
-                    </div>
-                    """, unsafe_allow_html=True)
+        generate_clicked = st.button("📝 Generate Quiz", key="generate_quiz")
+        quiz_status = st.container()
     
     with quiz_col2:
-        if st.session_state.quiz_data:
-            st.markdown("#### 📥 Download Options")
-            
-            # Download buttons
-            st.download_button(
-                label="📋 Quiz with Answers",
-                data=base64.b64decode(st.session_state.quiz_data["quiz_with_answers"]),
-                file_name="quiz_with_answers.pdf",
-                mime="application/pdf",
-                key="download_answers"
-            )
-            
-            st.download_button(
-                label="❓ Quiz Questions Only",
-                data=base64.b64decode(st.session_state.quiz_data["quiz_questions"]),
-                file_name="quiz_questions.pdf",
-                mime="application/pdf",
-                key="download_questions"
-            )
+        quiz_downloads = st.container()
+    
+    if generate_clicked:
+        # Drop the previous quiz while the new one streams in
+        st.session_state.quiz_data = None
+    elif st.session_state.quiz_data:
+        with quiz_downloads:
+            render_quiz_downloads(st.session_state.quiz_data)
     
     # Quiz Preview
-    if st.session_state.quiz_data:
-        with st.expander("👁️ Preview Quiz", expanded=False):
-            quiz_items = st.session_state.quiz_data.get("quiz_data", [])
+    if generate_clicked:
+        QUIZ_URL = "http://127.0.0.1:9999/generate_quiz/stream"
+        
+        payload = {
+            "topic": st.session_state["last_response"],
+            "language": st.session_state["language"],
+            "model_name": selected_model,
+            "model_provider": provider
+        }
+        
+        quiz_data = None
+        error_text = None
+        
+        # Questions show up in the preview as soon as each one is complete
+        with st.expander("👁️ Preview Quiz", expanded=True):
+            try:
+                with st.spinner("🧠 Creating your personalized quiz..."):
+                    for event, data in stream_sse(QUIZ_URL, payload):
+                        if event == "question":
+                            render_quiz_question(data["index"], data["question"])
+                        elif event == "done":
+                            quiz_data = data
+                        elif event == "error":
+                            error_text = data["error"]
+            except requests.RequestException as e:
+                error_text = f"Failed to connect to AI service: {e}"
+        
+        if quiz_data is not None:
+            st.session_state.quiz_data = quiz_data
             
-            for idx, item in enumerate(quiz_items):
-                st.markdown(f"""
-                <div class="glass-card">
-                    <h4>Question {idx + 1}</h4>
-                    <p><strong>{item.get('question', '')}</strong></p>
+            with quiz_status:
+                st.markdown("""
+                <div class="status-success">
+                    ✅ Quiz generated successfully! Download options available below.
                 </div>
                 """, unsafe_allow_html=True)
-                
-                options = item.get('options', [])
-                for i, option in enumerate(options):
-                    st.markdown(f"**{chr(65+i)}.** {option}")
-                
+            with quiz_downloads:
+                render_quiz_downloads(quiz_data)
+        else:
+            with quiz_status:
                 st.markdown(f"""
-                <div class="info-box">
-                    <strong>Answer:</strong> {item.get('answer', '')}<br>
-                    <strong>Explanation:</strong> {item.get('explanation', '')}
+                <div class="status-error">
+                    ❌ Quiz generation failed: {error_text}
                 </div>
                 """, unsafe_allow_html=True)
+    elif st.session_state.quiz_data:
+        with st.expander("👁️ Preview Quiz", expanded=False):
+            quiz_items = st.session_state.quiz_data.get("quiz_data", [])
+            
+            for idx, item in enumerate(quiz_items):
+                render_quiz_question(idx, item)
 
 # ========== Chat History Section ==========
 if st.session_state["chat_history"]:
@@ -769,7 +884,8 @@ if st.session_state["chat_history"]:
             </div>
             """, unsafe_allow_html=True)
             
-            if message.get("audio_path"):
+            # Older audio may have been evicted from the TTS cache
+            if message.get("audio_path") and os.path.exists(message["audio_path"]):
                 st.audio(message["audio_path"], format="audio/mp3")
 
 # ========== ElevenLabs ConvAI Section ==========
@@ -0,0 +1,230 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Stage latencies span sub-millisecond parsing up to multi-minute quiz calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = defaultdict(float)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (non-cumulative) + overflow, sum, count]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the with-block, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self, **labels):
+        """Return {"count", "sum"} observed so far for one label set"""
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            return {"count": series[2], "sum": series[1]} if series else {"count": 0, "sum": 0.0}
+
+    def _samples(self):
+        with self._lock:
+            values = {key: ([*series[0]], series[1], series[2]) for key, series in self._values.items()}
+        lines = []
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Minimal Prometheus text-format registry, no client library needed"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.register(Histogram(
+    "edugen_stage_duration_seconds",
+    "Time spent per pipeline stage (agent_build, llm_call, tool_call, json_extract, pdf_render)",
+    ["stage"]
+))
+requests_total = registry.register(Counter(
+    "edugen_requests_total",
+    "API requests by endpoint, model, provider, language and outcome",
+    ["endpoint", "model", "provider", "language", "outcome"]
+))
+quiz_questions_total = registry.register(Counter(
+    "edugen_quiz_questions_total",
+    "Quiz questions: served from the question bank, accepted, rejected by validation, or regenerated to replace rejects",
+    ["outcome"]
+))
+prompt_tokens_total = registry.register(Counter(
+    "edugen_prompt_tokens_total",
+    "Provider-reported prompt tokens, split by whether they were served from the provider's prompt cache",
+    ["endpoint", "provider", "model", "cache"]
+))
+time_to_first_token_seconds = registry.register(Histogram(
+    "edugen_time_to_first_token_seconds",
+    "Time from sending a streamed request to the provider until its first event, by prompt cache hit or miss",
+    ["endpoint", "provider", "prompt_cache"]
+))
+http_in_flight = registry.register(Gauge(
+    "edugen_http_requests_in_flight",
+    "HTTP requests currently being served",
+))
+http_duration_seconds = registry.register(Histogram(
+    "edugen_http_request_duration_seconds",
+    "Time from request start until the last response byte was sent",
+    ["route", "method", "status"]
+))
+payload_bytes = registry.register(Histogram(
+    "edugen_http_payload_bytes",
+    "Request and response body sizes",
+    ["route", "direction"],
+    buckets=SIZE_BUCKETS
+))
+
+
+class MetricsMiddleware:
+    """ASGI middleware tracking in-flight requests, durations and body sizes.
+
+    Bodies are counted as they pass through, so streamed responses are
+    measured in full without being buffered. Routes are labelled by their
+    path template to keep the label set bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        sizes = {"request": 0, "response": 0}
+        status = {"code": 500}
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            http_in_flight.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_duration_seconds.observe(
+                time.perf_counter() - started, route=route, method=scope["method"], status=status["code"]
+            )
+            for direction, size in sizes.items():
+                payload_bytes.observe(size, route=route, direction=direction)
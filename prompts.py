@@ -0,0 +1,52 @@
+# Prompt templates. Providers cache the longest prefix a request shares with
+# recent ones (OpenAI from 1024 tokens on, billed at a discount), so every
+# template puts the fixed instructions first and per-request text last.
+
+# Language-specific system prompt enhancements
+LANGUAGE_PROMPTS = {
+    "hi-IN": "कृपया हिंदी में उत्तर दें। सरल और स्पष्ट भाषा का प्रयोग करें।",
+    "bn-IN": "অনুগ্রহ করে বাংলায় উত্তর দিন। সহজ এবং স্পষ্ট ভাষা ব্যবহার করুন।",
+    "mr-IN": "कृपया मराठीत उत्तर द्या. सोपी आणि स्पष्ट भाषा वापरा.",
+    "ta-IN": "தமிழில் பதிலளிக்கவும். எளிய மற்றும் தெளிவான மொழியைப் பயன்படுத்தவும்.",
+    "te-IN": "దయచేసి తెలుగులో జవాబు ఇవ్వండి. సరళమైన మరియు స్పష్టమైన భాషను ఉపయోగించండి.",
+    "gu-IN": "કૃપા કરીને ગુજરાતીમાં જવાબ આપો. સરળ અને સ્પષ્ટ ભાષા નો ઉપયોગ કરો.",
+    "kn-IN": "ದಯವಿಟ್ಟು ಕನ್ನಡದಲ್ಲಿ ಉತ್ತರಿಸಿ. ಸರಳ ಮತ್ತು ಸ್ಪಷ್ಟ ಭಾಷೆಯನ್ನು ಬಳಸಿ.",
+    "ml-IN": "ദയവായി മലയാളത്തിൽ മറുപടി നൽകുക. ലളിതവും വ്യക്തവുമായ ഭാഷ ഉപയോഗിക്കുക.",
+    "pa-IN": "ਕਿਰਪਾ ਕਰਕੇ ਪੰਜਾਬੀ ਵਿੱਚ ਜਵਾਬ ਦਿਓ। ਸਧਾਰਨ ਅਤੇ ਸਪਸ਼ਟ ਭਾਸ਼ਾ ਦੀ ਵਰਤੋਂ ਕਰੋ।",
+    "ur-IN": "براہ کرم اردو میں جواب دیں۔ سادہ اور واضح زبان استعمال کریں۔"
+}
+
+QUIZ_SYSTEM_PROMPT = """You are an expert quiz creator who creates educational quizzes. Return only JSON format.
+
+For each question, provide:
+- The question text
+- 4 multiple choice options (labeled A, B, C, D)
+- The correct answer (specify the letter)
+- A brief explanation of why it's correct
+
+Format the response as a JSON array of objects with these keys:
+"question", "options", "answer", "explanation"
+
+Return ONLY the JSON array without any additional text."""
+
+
+def language_instruction(language):
+    if language in LANGUAGE_PROMPTS:
+        return LANGUAGE_PROMPTS[language]
+    # Default instruction for other languages
+    return f"Please respond in {language} language. Use simple and clear language."
+
+
+def chat_system_prompt(system_prompt, language):
+    """Language instruction first, it is shared by everyone using that language;
+    the user-editable system prompt after it"""
+    return "\n\n".join(part for part in (language_instruction(language), system_prompt.strip()) if part)
+
+
+def quiz_user_prompt(topic, count, existing=()):
+    """The per-request part of a quiz prompt, sent after QUIZ_SYSTEM_PROMPT"""
+    prompt = f"Generate a {count}-question quiz about the following topic.\n\nTopic: {topic}"
+    if existing:
+        listed = "\n".join(f"- {question}" for question in existing)
+        prompt += f"\n\nDo not repeat any of these questions:\n{listed}"
+    return prompt
@@ -0,0 +1,202 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from cache import make_key
+
+# Generated questions are kept here and reused for later quizzes on the same topic
+QUESTION_BANK_ENABLED = os.environ.get("QUESTION_BANK_ENABLED", "false").lower() in ("1", "true", "yes")
+QUESTION_BANK_PATH = os.environ.get("QUESTION_BANK_PATH", "question_bank.sqlite3")
+# Only reuse questions written by the model the request asks for
+QUESTION_BANK_SAME_MODEL = os.environ.get("QUESTION_BANK_SAME_MODEL", "false").lower() in ("1", "true", "yes")
+
+# Topics are often a whole previous answer: only its most frequent key terms are
+# searched, and a stored question must contain this share of them to be reused
+QUESTION_BANK_MAX_TERMS = int(os.environ.get("QUESTION_BANK_MAX_TERMS", "10"))
+QUESTION_BANK_MIN_MATCH = float(os.environ.get("QUESTION_BANK_MIN_MATCH", "0.5"))
+# Best-ranked matches checked against the threshold, per question wanted
+CANDIDATES_PER_QUESTION = 5
+
+# Words that say nothing about the topic
+STOP_WORDS = {
+    "a", "an", "the", "of", "and", "or", "in", "on", "for", "to", "about", "with", "quiz", "questions",
+    "is", "are", "was", "were", "be", "been", "being", "it", "its", "this", "that", "these", "those",
+    "as", "at", "by", "from", "into", "than", "then", "there", "their", "they", "them", "which", "who",
+    "what", "when", "where", "why", "how", "can", "could", "will", "would", "should", "may", "might",
+    "has", "have", "had", "do", "does", "did", "not", "but", "also", "such", "other", "more", "most",
+    "some", "any", "all", "each", "many", "much", "very", "so", "if", "we", "you", "your", "our",
+    "here", "one", "two", "use", "used", "using", "like", "well", "just", "only", "over", "between",
+    "through", "own", "make", "makes", "made",
+}
+TOKEN_SEPARATORS = re.compile(r"[\s.,;:!?\"'`()\[\]{}<>/\\|*+=#@&%^~-]+")
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS questions (
+        id INTEGER PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        language TEXT NOT NULL,
+        provider TEXT NOT NULL,
+        model TEXT NOT NULL,
+        topic TEXT NOT NULL,
+        question TEXT NOT NULL,
+        data TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        served INTEGER NOT NULL DEFAULT 0,
+        UNIQUE (language, fingerprint)
+    )""",
+    # External-content index over the question and topic text, kept in sync by triggers
+    """CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+        question, topic, content='questions', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS questions_ai AFTER INSERT ON questions BEGIN
+        INSERT INTO questions_fts (rowid, question, topic) VALUES (new.id, new.question, new.topic);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS questions_ad AFTER DELETE ON questions BEGIN
+        INSERT INTO questions_fts (questions_fts, rowid, question, topic) VALUES ('delete', old.id, old.question, old.topic);
+    END""",
+)
+
+
+def _words(text):
+    return [t for t in TOKEN_SEPARATORS.split(text.casefold()) if t]
+
+
+def question_fingerprint(question):
+    """Same key for questions differing only in case, spacing or punctuation"""
+    return make_key(" ".join(_words(question)))
+
+
+def topic_terms(topic, max_terms=QUESTION_BANK_MAX_TERMS):
+    """The topic's most frequent meaningful words, first occurrence breaking ties"""
+    tokens = _words(topic)
+    meaningful = [t for t in tokens if t not in STOP_WORDS and len(t) > 2 and not t.isdigit()] or tokens
+    counts = Counter(meaningful)
+    first = {}
+    for index, token in enumerate(meaningful):
+        first.setdefault(token, index)
+    return sorted(counts, key=lambda t: (-counts[t], first[t]))[:max_terms]
+
+
+def _phrase(term):
+    # Quoted so user text can never be read as FTS syntax
+    return '"' + term.replace('"', '""') + '"'
+
+
+def min_matching_terms(term_count, share=QUESTION_BANK_MIN_MATCH):
+    """Terms a question must contain: all of a one or two word topic, else the given share"""
+    return max(min(2, term_count), math.ceil(term_count * share))
+
+
+class QuestionBank:
+    """SQLite store of validated quiz questions with a full-text index.
+
+    Questions are de-duplicated per language by their normalized text and
+    tagged with the topic, language, provider and model that produced them.
+    ``find`` ranks questions containing any of the topic's key terms by
+    BM25 and keeps those containing enough of them, so a quiz can be
+    assembled from earlier generations before asking the LLM.
+    """
+
+    def __init__(self, path=QUESTION_BANK_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.served = 0
+        self.stored = 0
+
+    def _connect(self):
+        # sqlite3 connections must not be shared across threads or forks
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def add(self, questions, topic, language, provider, model):
+        """Store validated questions, returns how many were new"""
+        now = time.time()
+        rows = [
+            (question_fingerprint(q["question"]), language, provider, model, topic, q["question"],
+             json.dumps(q, ensure_ascii=False), now)
+            for q in questions
+        ]
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            added = conn.executemany(
+                "INSERT OR IGNORE INTO questions "
+                "(fingerprint, language, provider, model, topic, question, data, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            ).rowcount
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        with self._lock:
+            self.stored += added
+        return added
+
+    def find(self, topic, language, limit, model=None):
+        """Return up to ``limit`` stored questions matching the topic, best first"""
+        terms = topic_terms(topic)
+        if not terms or limit <= 0:
+            return []
+        sql = (
+            "SELECT q.id, q.data FROM questions_fts JOIN questions q ON q.id = questions_fts.rowid "
+            "WHERE questions_fts MATCH ? AND q.language = ?"
+        )
+        params = [" OR ".join(_phrase(t) for t in terms), language]
+        if model is not None:
+            sql += " AND q.model = ?"
+            params.append(model)
+        # Least served first among equally good matches, so repeat quizzes vary
+        sql += " ORDER BY bm25(questions_fts), q.served LIMIT ?"
+        params.append(limit * CANDIDATES_PER_QUESTION)
+
+        conn = self._connect()
+        candidates = conn.execute(sql, params).fetchall()
+        rows = []
+        if candidates:
+            # Count per candidate how many terms it contains, stemmed like the index
+            ids = [row[0] for row in candidates]
+            matched = Counter()
+            check = (
+                "SELECT rowid FROM questions_fts WHERE questions_fts MATCH ? "
+                f"AND rowid IN ({', '.join('?' * len(ids))})"
+            )
+            for term in terms:
+                matched.update(rowid for (rowid,) in conn.execute(check, [_phrase(term), *ids]))
+            needed = min_matching_terms(len(terms))
+            rows = [row for row in candidates if matched[row[0]] >= needed][:limit]
+        if rows:
+            conn.executemany("UPDATE questions SET served = served + 1 WHERE id = ?", [(row[0],) for row in rows])
+        with self._lock:
+            self.served += len(rows)
+        return [json.loads(data) for _, data in rows]
+
+    def stats(self):
+        if not QUESTION_BANK_ENABLED:
+            # Don't create the database just to report on it
+            return {"enabled": False}
+        total = self._connect().execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+        with self._lock:
+            return {
+                "enabled": QUESTION_BANK_ENABLED,
+                "questions": total,
+                # Counters are this worker's own
+                "stored": self.stored,
+                "served": self.served,
+            }
+
+
+question_bank = QuestionBank()
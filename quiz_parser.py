@@ -0,0 +1,218 @@
+import json
+import re
+from typing import List, Literal
+from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
+
+# "A) text", "B. text", "(C) text" and "D: text" all become "text"
+OPTION_LABEL = re.compile(r"^\(?([A-Da-d])[\).:]\s+")
+# A bare letter or a label ("C", "(c)", "Option C", "C) ..."), not text that starts with "A "
+ANSWER_LETTER = re.compile(r"^\(?(?:option\s+)?([A-Da-d])\s*(?:[\).:-]|$)", re.IGNORECASE)
+# Where the question array starts, a "[" in prose is not followed by "{"
+ARRAY_OF_OBJECTS = re.compile(r"\[\s*\{")
+
+
+class QuizQuestion(BaseModel):
+    """One multiple choice question with exactly four options"""
+
+    question: str = Field(min_length=1, description="The question text")
+    options: List[str] = Field(min_length=4, max_length=4, description="Exactly four answer options, without A-D labels")
+    answer: Literal["A", "B", "C", "D"] = Field(description="Letter of the correct option")
+    explanation: str = Field(default="", description="Brief explanation of why the answer is correct")
+
+    @field_validator("options", mode="before")
+    @classmethod
+    def strip_option_labels(cls, options):
+        if isinstance(options, list):
+            return [OPTION_LABEL.sub("", o).strip() if isinstance(o, str) else o for o in options]
+        return options
+
+    @field_validator("options")
+    @classmethod
+    def distinct_options(cls, options):
+        if len({o.casefold() for o in options}) != len(options):
+            raise ValueError("options must be distinct")
+        return options
+
+    @model_validator(mode="before")
+    @classmethod
+    def normalize_answer(cls, data):
+        if not isinstance(data, dict) or not isinstance(data.get("answer"), str):
+            return data
+        answer = data["answer"].strip()
+        # Some models answer with the option text instead of its letter. Checked
+        # first: "A bird" is the text of an option, not the letter A.
+        options = [OPTION_LABEL.sub("", o).strip().casefold() for o in data.get("options") or [] if isinstance(o, str)]
+        if answer.casefold() in options:
+            return dict(data, answer="ABCD"[options.index(answer.casefold())])
+        match = ANSWER_LETTER.match(answer)
+        if match:
+            return dict(data, answer=match.group(1).upper())
+        return data
+
+
+class Quiz(BaseModel):
+    """A multiple choice quiz"""
+
+    questions: List[QuizQuestion]
+
+
+def validate_quiz_questions(items, existing=()):
+    """Validate raw question dicts one by one, returns (valid questions, rejected count).
+
+    A question that fails the schema or repeats one already in ``existing``
+    is rejected on its own without affecting the others.
+    """
+    seen = {q["question"].strip().casefold() for q in existing}
+    valid = []
+    rejected = 0
+    for item in items:
+        try:
+            question = QuizQuestion.model_validate(item)
+        except ValidationError:
+            rejected += 1
+            continue
+        key = question.question.strip().casefold()
+        if key in seen:
+            rejected += 1
+            continue
+        seen.add(key)
+        valid.append(question.model_dump())
+    return valid, rejected
+
+
+def extract_quiz_items(message):
+    """Raw question dicts from a structured-output reply.
+
+    Tool-call arguments are used when the model called the quiz tool;
+    otherwise any JSON in the text is salvaged.
+    """
+    for call in getattr(message, "tool_calls", None) or []:
+        items = call.get("args", {}).get("questions")
+        if isinstance(items, list):
+            return items
+    content = message.content
+    if not isinstance(content, str):
+        content = "".join(block.get("text", "") for block in content if isinstance(block, dict))
+    questions, parsed_ok = parse_quiz_questions(content)
+    return questions if parsed_ok else []
+
+
+class IncrementalJSONArrayParser:
+    """Pull complete objects out of a JSON array while it is still streaming in.
+
+    Text before the opening ``[`` (prose, code fences) is skipped; only a
+    ``[`` followed by ``{`` opens the array, so brackets in prose do not. Each
+    top-level ``{...}`` element is decoded as soon as its closing brace
+    arrives. An element that fails to decode is counted in ``errors`` and
+    skipped, so one malformed question does not lose the rest of the quiz.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._bracket = False  # Saw a "[" outside the array, waiting for "{"
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = None
+        self.errors = 0
+
+    @property
+    def done(self):
+        return self._done
+
+    def feed(self, text):
+        """Add streamed text and return the objects completed by it"""
+        if self._done:
+            return []
+        self._buffer += text
+        completed = []
+        buffer = self._buffer
+        pos = self._pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if not self._in_array:
+                if self._bracket and char == "{":
+                    # Handled again below as the first element
+                    self._in_array = True
+                    continue
+                if not (self._bracket and char.isspace()):
+                    self._bracket = char == "["
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._object_start = pos
+                self._depth += 1
+            elif char == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    obj = self._decode(buffer[self._object_start:pos + 1])
+                    if obj is not None:
+                        completed.append(obj)
+                    self._object_start = None
+            elif char == "]" and self._depth == 0:
+                self._done = True
+                pos += 1
+                break
+            pos += 1
+
+        # Keep only the unfinished element so the buffer stays small
+        if self._object_start is not None:
+            self._buffer = buffer[self._object_start:]
+            self._pos = pos - self._object_start
+            self._object_start = 0
+        else:
+            self._buffer = ""
+            self._pos = 0
+        return completed
+
+    def _decode(self, text):
+        try:
+            obj = json.loads(text)
+        except ValueError:
+            self.errors += 1
+            return None
+        if not isinstance(obj, dict):
+            self.errors += 1
+            return None
+        return obj
+
+
+def parse_quiz_questions(quiz_data):
+    """Extract the question list from model output, returns (questions, parsed_ok)"""
+    # Fast path: everything from the first [{ to the last ] is valid JSON
+    start = ARRAY_OF_OBJECTS.search(quiz_data)
+    if start is not None:
+        try:
+            questions = json.loads(quiz_data[start.start():quiz_data.rfind(']') + 1])
+            if isinstance(questions, list) and questions:
+                return questions, True
+        except ValueError:
+            pass
+
+    # Otherwise salvage every well-formed question object
+    parser = IncrementalJSONArrayParser()
+    questions = parser.feed(quiz_data)
+    if questions:
+        return questions, True
+
+    return quiz_error_placeholder(quiz_data), False
+
+
+def quiz_error_placeholder(quiz_data):
+    return [{
+        "question": "Quiz parsing error",
+        "options": ["A: Error in parsing", "B: Contact support"],
+        "answer": "A",
+        "explanation": f"Original response: {quiz_data}"
+    }]
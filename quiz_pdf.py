@@ -0,0 +1,110 @@
+import gzip
+import hashlib
+from io import BytesIO
+from xml.sax.saxutils import escape
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet
+
+# Quiz PDF rendering lives in its own module so process-pool workers can
+# import it without pulling in the FastAPI app and the LLM clients.
+
+# Built once and only read afterwards, so it is safe to share across requests
+PDF_STYLES = getSampleStyleSheet()
+
+class PDFRenderError(Exception):
+    """Raised when a quiz PDF cannot be built.
+
+    A plain exception so it pickles back from process-pool workers; the
+    endpoints turn it into an HTTP error.
+    """
+
+def _pdf_title(language, with_answers):
+    if with_answers:
+        return "Quiz with Answers" if language.startswith("en") else "उत्तरों के साथ प्रश्नोत्तरी"
+    return "Quiz Questions" if language.startswith("en") else "प्रश्नोत्तरी"
+
+def _start_flowables(language, with_answers):
+    return [
+        Paragraph(f"<b>{_pdf_title(language, with_answers)}</b>", PDF_STYLES['Title']),
+        Spacer(1, 12)
+    ]
+
+def _append_question(flowables, idx, item, with_answers):
+    # Question
+    # Paragraph parses its text as markup, so model text is escaped first
+    q_text = f"<b>Q{idx+1}: {escape(str(item.get('question', '')))}</b>"
+    flowables.append(Paragraph(q_text, PDF_STYLES['Normal']))
+    
+    # Options
+    options = item.get('options', [])
+    for i, option in enumerate(options):
+        flowables.append(Paragraph(f"{chr(65+i)}. {escape(str(option))}", PDF_STYLES['Normal']))
+    
+    # Answer and explanation (only for answers PDF)
+    if with_answers:
+        answer = escape(str(item.get('answer', '')))
+        explanation = escape(str(item.get('explanation', '')))
+        flowables.append(Paragraph(f"<b>Answer:</b> {answer}", PDF_STYLES['Normal']))
+        if explanation:
+            flowables.append(Paragraph(f"<i>Explanation:</i> {explanation}", PDF_STYLES['Normal']))
+    
+    flowables.append(Spacer(1, 12))
+
+def _render_pdf(flowables):
+    # Each call gets its own buffer, so concurrent requests never share a file
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    doc.build(flowables)
+    return buffer.getvalue()
+
+def _is_question_list(content):
+    return isinstance(content, list) and all(isinstance(q, dict) for q in content)
+
+def create_pdf(content, filename, language):
+    """Create a PDF file with quiz content"""
+    try:
+        with_answers = "with_answers" in filename
+        flowables = _start_flowables(language, with_answers)
+        
+        # Check if content is a list of questions
+        if _is_question_list(content):
+            for idx, item in enumerate(content):
+                _append_question(flowables, idx, item, with_answers)
+        else:
+            # Handle text content
+            flowables.append(Paragraph(f"<b>Content:</b> {escape(str(content))}", PDF_STYLES['Normal']))
+        
+        return _render_pdf(flowables)
+    
+    except Exception as e:
+        raise PDFRenderError(f"PDF creation failed: {str(e)}") from e
+
+def create_quiz_pdfs(quiz_questions, language):
+    """Render the with-answers and questions-only PDFs in one pass over the quiz"""
+    if not _is_question_list(quiz_questions):
+        return (
+            create_pdf(quiz_questions, "quiz_with_answers", language),
+            create_pdf(quiz_questions, "quiz_questions", language)
+        )
+
+    try:
+        answers_flowables = _start_flowables(language, True)
+        questions_flowables = _start_flowables(language, False)
+        for idx, item in enumerate(quiz_questions):
+            _append_question(answers_flowables, idx, item, True)
+            _append_question(questions_flowables, idx, item, False)
+        return _render_pdf(answers_flowables), _render_pdf(questions_flowables)
+    
+    except Exception as e:
+        raise PDFRenderError(f"PDF creation failed: {str(e)}") from e
+
+def build_quiz_entry(quiz_questions, language):
+    """Render a quiz for the store, keeping PDFs gzip-compressed with their ETags"""
+    qa_pdf, questions_pdf = create_quiz_pdfs(quiz_questions, language)
+    pdfs = {"with_answers": qa_pdf, "questions": questions_pdf}
+    return {
+        "quiz_data": quiz_questions,
+        "pdfs": {variant: gzip.compress(pdf) for variant, pdf in pdfs.items()},
+        "etags": {variant: f'"{hashlib.sha256(pdf).hexdigest()[:32]}"' for variant, pdf in pdfs.items()}
+    }
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+# Where to send a request when its primary (provider, model) is slow or failing
+FALLBACK_ROUTES = {
+    "Groq": ("OpenAI", "gpt-4o-mini"),
+    "OpenAI": ("Groq", "llama-3.3-70b-versatile"),
+}
+
+# Per-endpoint routing. Chat is latency sensitive and hedges at the primary's
+# p95; quizzes tolerate slow answers and only fail over on errors.
+ROUTING_POLICIES = {
+    "chat": {"hedge": True, "hedge_percentile": 0.95, "min_samples": 20, "failover": True},
+    "quiz": {"hedge": False, "hedge_percentile": 0.99, "min_samples": 20, "failover": True},
+    "quiz_batch": {"hedge": False, "hedge_percentile": 0.99, "min_samples": 20, "failover": True},
+}
+DEFAULT_POLICY = {"hedge": False, "hedge_percentile": 0.95, "min_samples": 20, "failover": True}
+
+# e.g. ROUTING_POLICIES='{"quiz": {"hedge": true}}' to override per endpoint
+for _endpoint, _overrides in json.loads(os.environ.get("ROUTING_POLICIES", "{}")).items():
+    ROUTING_POLICIES[_endpoint] = dict(ROUTING_POLICIES.get(_endpoint, DEFAULT_POLICY), **_overrides)
+
+LATENCY_WINDOW = int(os.environ.get("ROUTING_LATENCY_WINDOW", "200"))
+
+
+def is_retryable(exc):
+    """True for rate limits, server errors, timeouts and dropped connections"""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is not None:
+        return status == 429 or 500 <= status < 600
+    name = type(exc).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per (provider, model)"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def observe(self, key, seconds):
+        with self._lock:
+            self._samples[key].append(seconds)
+
+    def percentile(self, key, fraction, min_samples=1):
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        index = min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))
+        return samples[index]
+
+    def stats(self):
+        with self._lock:
+            keys = list(self._samples)
+        return [
+            {
+                "provider": provider,
+                "model": model,
+                "samples": len(self._samples[(provider, model)]),
+                "p50": self.percentile((provider, model), 0.50),
+                "p95": self.percentile((provider, model), 0.95),
+            }
+            for provider, model in keys
+        ]
+
+
+class Router:
+    """Hedged requests and failover across providers.
+
+    ``make_call(provider, model, started)`` must return a fresh coroutine
+    for one attempt and call ``started()`` once it is admitted, right before
+    the provider request, so local queueing is not counted as provider
+    latency. The primary runs first; if it outlives the primary's latency
+    percentile a backup is fired at the fallback route and the first
+    success wins, the loser is cancelled. A retryable error on the primary
+    fails over to the fallback route.
+    """
+
+    def __init__(self):
+        self.latency = LatencyTracker()
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0}
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def policy(self, endpoint):
+        return ROUTING_POLICIES.get(endpoint, DEFAULT_POLICY)
+
+    def fallback(self, provider, model):
+        route = FALLBACK_ROUTES.get(provider)
+        return None if route is None or route == (provider, model) else route
+
+    async def _timed(self, route, make_call):
+        clock = {"started": time.perf_counter()}
+
+        def started():
+            clock["started"] = time.perf_counter()
+
+        result = await make_call(*route, started)
+        self.latency.observe(route, time.perf_counter() - clock["started"])
+        return result
+
+    async def call(self, endpoint, provider, model, make_call):
+        """Run one request under the endpoint's policy, returns (result, (provider, model))"""
+        self.count("calls")
+        policy = self.policy(endpoint)
+        primary_route = (provider, model)
+        backup_route = self.fallback(provider, model)
+
+        hedge_delay = None
+        if policy["hedge"] and backup_route is not None:
+            hedge_delay = self.latency.percentile(primary_route, policy["hedge_percentile"], policy["min_samples"])
+
+        primary = asyncio.ensure_future(self._timed(primary_route, make_call))
+        tasks = {primary: primary_route}
+        try:
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+                if not done:
+                    self.count("hedges")
+                    tasks[asyncio.ensure_future(self._timed(backup_route, make_call))] = backup_route
+
+            primary_error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.count("hedge_wins")
+                        return task.result(), tasks[task]
+                    if task is primary:
+                        primary_error = task.exception()
+
+            # Fail over unless the backup already had its chance as a hedge
+            if policy["failover"] and backup_route is not None and len(tasks) == 1 and is_retryable(primary_error):
+                self.count("failovers")
+                return await self._timed(backup_route, make_call), backup_route
+            raise primary_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        return dict(counters, latency=self.latency.stats())
+
+
+router = Router()
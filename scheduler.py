@@ -0,0 +1,196 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+from collections import defaultdict
+
+# Priority classes, lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_QUIZ = 1
+PRIORITY_BATCH = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_QUIZ: "quiz", PRIORITY_BATCH: "batch"}
+
+ENDPOINT_PRIORITIES = {
+    "chat": PRIORITY_INTERACTIVE,
+    "quiz": PRIORITY_QUIZ,
+    "quiz_batch": PRIORITY_BATCH,
+}
+
+# Completion tokens to reserve up front, corrected once real usage is known
+EXPECTED_COMPLETION_TOKENS = {
+    "chat": 400,
+    "quiz": 2000,
+    "quiz_batch": 2000,
+}
+
+# Requests and tokens per minute, off unless configured. Keys are a provider
+# or "provider/model"; a model entry overrides its provider's limits. The
+# limits apply per worker process: with N workers, configure the account's
+# limits divided by N. e.g. RATE_LIMITS='{"Groq": {"rpm": 30, "tpm": 6000}}'
+RATE_LIMITS = json.loads(os.environ.get("RATE_LIMITS", "{}"))
+# Longest a request may wait for its rate limit before it fails
+RATE_LIMIT_MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT", "30"))
+
+
+class RateLimitWaitError(Exception):
+    """A request queued longer than RATE_LIMIT_MAX_WAIT for its rate limit"""
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at ``per_minute`` / 60 per second"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until ``amount`` can be taken, 0 if it can be taken now"""
+        self._refill()
+        amount = min(amount, self.capacity)  # An oversized request must still run eventually
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        """Give back (negative) or take more (positive) after the fact"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class _Lane:
+    def __init__(self, limits):
+        self.requests = TokenBucket(limits["rpm"])
+        self.tokens = TokenBucket(limits["tpm"])
+        self.queue = []
+        self.timer = None
+
+
+class RateLimitScheduler:
+    """Per (provider, model) token-bucket admission with priority queueing.
+
+    Work that would exceed the requests-per-minute or tokens-per-minute
+    budget waits in a priority queue instead of failing with a 429:
+    interactive chat is admitted before quiz generation, which is admitted
+    before batch jobs. Work that waits longer than ``max_wait`` seconds fails
+    with RateLimitWaitError. Must be used from a single event loop.
+    """
+
+    def __init__(self, max_wait=RATE_LIMIT_MAX_WAIT):
+        self.max_wait = max_wait
+        self._lanes = {}
+        self._sequence = itertools.count()
+        self.admitted = defaultdict(int)
+        self.wait_seconds = defaultdict(float)
+        self.max_wait_seconds = defaultdict(float)
+
+    def _limits(self, provider, model):
+        return RATE_LIMITS.get(f"{provider}/{model}") or RATE_LIMITS.get(provider)
+
+    def _lane(self, provider, model):
+        key = (provider, model)
+        lane = self._lanes.get(key)
+        if lane is None:
+            limits = self._limits(provider, model)
+            if limits is None:
+                return None
+            lane = self._lanes[key] = _Lane(limits)
+        return lane
+
+    async def acquire(self, provider, model, priority, tokens):
+        """Wait until the request may be sent, returns the seconds spent queued"""
+        lane = self._lane(provider, model)
+        if lane is None:
+            return 0.0
+        enqueued = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(lane.queue, (priority, next(self._sequence), future, tokens))
+        self._pump(lane)
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except asyncio.TimeoutError:
+            # wait_for cancelled the future, _pump skips the queued entry
+            self._pump(lane)
+            raise RateLimitWaitError(
+                f"Waited more than {self.max_wait:g}s for the {provider} {model} rate limit, try again later"
+            ) from None
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just before the cancel, hand the budget back
+                lane.requests.adjust(-1)
+                lane.tokens.adjust(-tokens)
+            else:
+                # The queued entry is skipped by _pump once its future is cancelled
+                future.cancel()
+            self._pump(lane)
+            raise
+        waited = time.monotonic() - enqueued
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        self.admitted[name] += 1
+        self.wait_seconds[name] += waited
+        self.max_wait_seconds[name] = max(self.max_wait_seconds[name], waited)
+        return waited
+
+    def settle(self, provider, model, reserved_tokens, actual_tokens):
+        """Correct the token bucket once the real usage of a request is known"""
+        lane = self._lane(provider, model)
+        if lane is not None:
+            lane.tokens.adjust(actual_tokens - reserved_tokens)
+
+    def _pump(self, lane):
+        if lane.timer is not None:
+            lane.timer.cancel()
+            lane.timer = None
+        while lane.queue:
+            priority, _, future, tokens = lane.queue[0]
+            if future.done():
+                heapq.heappop(lane.queue)
+                continue
+            wait = max(lane.requests.wait_time(1), lane.tokens.wait_time(tokens))
+            if wait > 0:
+                # Strict priority: nothing overtakes the head of the queue
+                lane.timer = asyncio.get_running_loop().call_later(wait, self._pump, lane)
+                return
+            heapq.heappop(lane.queue)
+            lane.requests.consume(1)
+            lane.tokens.consume(tokens)
+            future.set_result(None)
+
+    def stats(self):
+        lanes = []
+        for (provider, model), lane in self._lanes.items():
+            depth = defaultdict(int)
+            for priority, _, future, _ in lane.queue:
+                if not future.done():
+                    depth[PRIORITY_NAMES.get(priority, str(priority))] += 1
+            lanes.append({
+                "provider": provider,
+                "model": model,
+                "queue_depth": dict(depth),
+                "requests_available": round(lane.requests.tokens, 2),
+                "tokens_available": round(lane.tokens.tokens, 2),
+            })
+        waits = {
+            name: {
+                "admitted": count,
+                "avg_wait_seconds": self.wait_seconds[name] / count,
+                "max_wait_seconds": self.max_wait_seconds[name],
+            }
+            for name, count in self.admitted.items()
+        }
+        return {"lanes": lanes, "waits": waits}
+
+
+scheduler = RateLimitScheduler()
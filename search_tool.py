@@ -0,0 +1,121 @@
+import asyncio
+import os
+import threading
+import time
+from langchain_core.tools import StructuredTool
+from cache import make_cache, make_key, normalize_text
+from cassette import cassette
+
+# Web search results are shared by every agent and user in the process
+SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", "900"))
+# How long an expired result may still be served while it is refreshed
+SEARCH_CACHE_STALE_TTL = int(os.environ.get("SEARCH_CACHE_STALE_TTL", "3600"))
+SEARCH_CACHE_MAX_BYTES = int(os.environ.get("SEARCH_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+search_cache = make_cache("search", ttl=SEARCH_CACHE_TTL, max_bytes=SEARCH_CACHE_MAX_BYTES)
+
+
+class CachedSearch:
+    """Stale-while-revalidate cache in front of a search tool.
+
+    Results are keyed by normalized query and the tool's max_results. A
+    fresh hit skips the network; a stale hit is returned immediately and
+    refreshed in the background; a miss calls the tool. Error strings from
+    the tool are passed through but never cached.
+    """
+
+    def __init__(self, tool, cache=search_cache):
+        self.tool = tool
+        self.cache = cache
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _key(self, query):
+        return make_key(self.tool.name, normalize_text(query), getattr(self.tool, "max_results", None))
+
+    def _store(self, key, result):
+        # Tavily reports failures as a repr string instead of raising
+        if isinstance(result, list):
+            self.cache.set(key, result, stale_ttl=SEARCH_CACHE_STALE_TTL)
+        return result
+
+    async def _astore(self, key, result):
+        if isinstance(result, list):
+            await self.cache.aset(key, result, stale_ttl=SEARCH_CACHE_STALE_TTL)
+        return result
+
+    def _search(self, key, query):
+        """Call the wrapped tool, or serve/save the exchange when a cassette is active"""
+        if cassette.replaying:
+            return cassette.replay("search", key)
+        started = time.perf_counter()
+        result = self.tool.invoke({"query": query})
+        if cassette.recording:
+            cassette.record("search", key, result, time.perf_counter() - started)
+        return result
+
+    async def _asearch(self, key, query):
+        if cassette.replaying:
+            return await cassette.areplay("search", key)
+        started = time.perf_counter()
+        result = await self.tool.ainvoke({"query": query})
+        if cassette.recording:
+            cassette.record("search", key, result, time.perf_counter() - started)
+        return result
+
+    def _claim_refresh(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _release_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def run(self, query):
+        key = self._key(query)
+        hit = self.cache.get_with_staleness(key)
+        if hit is not None:
+            result, stale = hit
+            if stale and self._claim_refresh(key):
+                threading.Thread(target=self._refresh, args=(key, query), daemon=True).start()
+            return result
+        return self._store(key, self._search(key, query))
+
+    def _refresh(self, key, query):
+        try:
+            self._store(key, self._search(key, query))
+        except Exception:
+            pass  # Keep serving the stale result until it ages out
+        finally:
+            self._release_refresh(key)
+
+    async def arun(self, query):
+        key = self._key(query)
+        hit = await self.cache.aget_with_staleness(key)
+        if hit is not None:
+            result, stale = hit
+            if stale and self._claim_refresh(key):
+                asyncio.ensure_future(self._arefresh(key, query))
+            return result
+        return await self._astore(key, await self._asearch(key, query))
+
+    async def _arefresh(self, key, query):
+        try:
+            await self._astore(key, await self._asearch(key, query))
+        except Exception:
+            pass  # Keep serving the stale result until it ages out
+        finally:
+            self._release_refresh(key)
+
+    def as_tool(self):
+        """Expose the cached search with the wrapped tool's name, description and schema"""
+        return StructuredTool.from_function(
+            func=self.run,
+            coroutine=self.arun,
+            name=self.tool.name,
+            description=self.tool.description,
+            args_schema=self.tool.args_schema,
+        )
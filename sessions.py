@@ -0,0 +1,134 @@
+import asyncio
+import os
+import threading
+from cache import make_cache
+from tokens import count_tokens, MESSAGE_OVERHEAD_TOKENS
+
+# Token budget for system prompt + history + new message, per model.
+# Leaves room for the completion inside each model's context window.
+MODEL_HISTORY_BUDGETS = {
+    "llama3-70b-8192": 4000,
+    "mixtral-8x7b-32768": 16000,
+    "llama-3.3-70b-versatile": 16000,
+    "gpt-4o-mini": 16000,
+}
+DEFAULT_HISTORY_BUDGET = 4000
+
+SESSION_IDLE_TTL = int(os.environ.get("SESSION_IDLE_TTL", "1800"))
+SESSION_MAX_COUNT = int(os.environ.get("SESSION_MAX_COUNT", "10000"))
+SESSION_MAX_BYTES = int(os.environ.get("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Upper bound for the running summary of turns dropped from the history
+SUMMARY_MAX_CHARS = 1200
+
+
+def message_tokens(message):
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+class SessionStore:
+    """Conversation sessions with token-budgeted history.
+
+    Each session keeps alternating user/assistant turns. When the history no
+    longer fits the model's budget the oldest turns are dropped and folded
+    into a short running summary, so prompt size stays flat. Sessions live
+    in a cache backend (shared across workers with CACHE_BACKEND=sqlite)
+    and expire after ``idle_ttl`` seconds without use.
+    """
+
+    def __init__(self, idle_ttl=SESSION_IDLE_TTL, max_sessions=SESSION_MAX_COUNT, cache=None):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        if cache is None:
+            cache = make_cache("sessions", ttl=idle_ttl, max_bytes=SESSION_MAX_BYTES, max_entries=max_sessions)
+        self.cache = cache
+        self._lock = threading.Lock()
+        self.trimmed_turns = 0
+
+    def _update(self, session_id, func):
+        # One atomic read-modify-write, so concurrent requests on a session
+        # (in this or another worker) cannot lose turns or a trim.
+        # Writing back on every use keeps the idle TTL sliding.
+        return self.cache.update(session_id, lambda session: func(session or {"turns": [], "summary": ""}))
+
+    def build_messages(self, session_id, new_messages, model_name, system_prompt=""):
+        """Return prior turns that fit the budget followed by the new user messages"""
+        budget = MODEL_HISTORY_BUDGETS.get(model_name, DEFAULT_HISTORY_BUDGET)
+        new_turns = [{"role": "user", "content": m} for m in new_messages]
+        base_tokens = count_tokens(system_prompt) + sum(message_tokens(m) for m in new_turns)
+        history = []
+
+        def trim(session):
+            used = base_tokens
+            turns = session["turns"]
+            if session["summary"]:
+                used += count_tokens(session["summary"]) + MESSAGE_OVERHEAD_TOKENS
+
+            # Walk back from the newest turn and keep as much as fits
+            keep = 0
+            for turn in reversed(turns):
+                cost = message_tokens(turn)
+                if used + cost > budget:
+                    break
+                used += cost
+                keep += 1
+
+            dropped = turns[:len(turns) - keep]
+            if dropped:
+                session["summary"] = self._fold_into_summary(session["summary"], dropped)
+                del turns[:len(dropped)]
+                with self._lock:
+                    self.trimmed_turns += len(dropped)
+
+            # Copied while the session is still locked
+            if session["summary"]:
+                history.append({
+                    "role": "system",
+                    "content": f"Summary of the earlier conversation: {session['summary']}"
+                })
+            history.extend(dict(turn) for turn in turns)
+            return session
+
+        self._update(session_id, trim)
+        return history + new_turns
+
+    def _fold_into_summary(self, summary, dropped):
+        # Extractive summary: remember what the student asked about
+        topics = [turn["content"].strip().replace("\n", " ")[:120] for turn in dropped if turn["role"] == "user"]
+        if not topics:
+            return summary
+        summary = (summary + "; " if summary else "The student previously asked about: ") + "; ".join(topics)
+        if len(summary) > SUMMARY_MAX_CHARS:
+            summary = "..." + summary[-SUMMARY_MAX_CHARS:]
+        return summary
+
+    def append(self, session_id, user_messages, assistant_text):
+        """Record a completed exchange"""
+        def add_turns(session):
+            session["turns"].extend({"role": "user", "content": m} for m in user_messages)
+            session["turns"].append({"role": "assistant", "content": assistant_text})
+            return session
+
+        self._update(session_id, add_turns)
+
+    async def abuild_messages(self, session_id, new_messages, model_name, system_prompt=""):
+        # A blocking cache backend is kept off the event loop
+        if self.cache.blocking:
+            return await asyncio.to_thread(self.build_messages, session_id, new_messages, model_name, system_prompt)
+        return self.build_messages(session_id, new_messages, model_name, system_prompt)
+
+    async def aappend(self, session_id, user_messages, assistant_text):
+        if self.cache.blocking:
+            return await asyncio.to_thread(self.append, session_id, user_messages, assistant_text)
+        return self.append(session_id, user_messages, assistant_text)
+
+    def clear(self, session_id):
+        self.cache.delete(session_id)
+
+    def stats(self):
+        cache_stats = self.cache.stats()
+        return {
+            "sessions": cache_stats["entries"],
+            "evictions": cache_stats["evictions"],
+            "trimmed_turns": self.trimmed_turns,
+        }
@@ -0,0 +1,122 @@
+import asyncio
+
+
+class _CallFlight:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class _StreamFlight:
+    def __init__(self):
+        self.events = []
+        self.finished = False
+        self.error = None
+        self.changed = asyncio.Condition()
+        self.task = None
+        self.subscribers = 0
+
+
+class SingleFlight:
+    """Coalesce identical in-flight calls so they share one upstream request.
+
+    ``call`` shares the result of one coroutine between every concurrent
+    caller with the same key. ``stream`` does the same for async generators:
+    each subscriber gets every event from the start, including callers that
+    join while the stream is already running. The upstream work is shielded,
+    so one caller disconnecting does not cancel it for the others; once the
+    last caller or subscriber is gone, the upstream run is cancelled.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def call(self, key, make_call):
+        """Return make_call()'s result, sharing one run among concurrent callers"""
+        flight = self._calls.get(key)
+        if flight is None:
+            self.leaders += 1
+            flight = self._calls[key] = _CallFlight(asyncio.ensure_future(make_call()))
+            flight.task.add_done_callback(lambda _: self._forget(self._calls, key, flight))
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Every caller gave up, stop spending tokens on it
+                self._forget(self._calls, key, flight)
+                flight.task.cancel()
+
+    async def stream(self, key, make_stream):
+        """Yield make_stream()'s events, sharing one run among concurrent subscribers"""
+        flight = self._streams.get(key)
+        if flight is None:
+            self.leaders += 1
+            flight = _StreamFlight()
+            self._streams[key] = flight
+            flight.task = asyncio.ensure_future(self._pump(key, flight, make_stream))
+        else:
+            self.coalesced += 1
+
+        flight.subscribers += 1
+        try:
+            position = 0
+            while True:
+                async with flight.changed:
+                    await flight.changed.wait_for(lambda: len(flight.events) > position or flight.finished)
+                    batch = flight.events[position:]
+                    position += len(batch)
+                    finished = flight.finished
+                for event in batch:
+                    # Subscribers may modify what they get, hand each its own copy
+                    yield dict(event)
+                if finished:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.finished:
+                # Nobody is listening any more, stop spending tokens on it
+                self._forget(self._streams, key, flight)
+                flight.task.cancel()
+
+    @staticmethod
+    def _forget(flights, key, flight):
+        # New callers start a fresh run from here on
+        if flights.get(key) is flight:
+            del flights[key]
+
+    async def _pump(self, key, flight, make_stream):
+        try:
+            async for event in make_stream():
+                async with flight.changed:
+                    flight.events.append(event)
+                    flight.changed.notify_all()
+        except asyncio.CancelledError:
+            # Subscribers must not mistake a cut-off stream for a complete one
+            flight.error = RuntimeError("The upstream stream was cancelled")
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            self._forget(self._streams, key, flight)
+            async with flight.changed:
+                flight.finished = True
+                flight.changed.notify_all()
+
+    def stats(self):
+        upstream = self.leaders
+        return {
+            "upstream_calls": upstream,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls) + len(self._streams),
+            "coalesced_rate": self.coalesced / (upstream + self.coalesced) if upstream + self.coalesced else 0.0,
+        }
@@ -0,0 +1,106 @@
+import os
+import queue
+import re
+import threading
+
+# A sentence ends at . ! ? or a danda followed by whitespace, or at a line break
+SENTENCE_END = re.compile(r"(?<=[.!?।॥])\s+|\n+")
+# Shorter sentences are joined with the next one: fewer TTS calls and smoother speech
+MIN_SENTENCE_CHARS = int(os.environ.get("TTS_MIN_SENTENCE_CHARS", "20"))
+
+_END = object()
+
+
+class SentenceSplitter:
+    """Cut streamed text into sentences as soon as each one is complete"""
+
+    def __init__(self, min_chars=MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, text):
+        """Add text, returns the sentences it completed"""
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self.buffer):
+            # Trailing whitespace may still grow, wait for the next character
+            if match.end() == len(self.buffer):
+                break
+            sentence = self.buffer[start:match.start()].strip()
+            if len(sentence) >= self.min_chars:
+                sentences.append(sentence)
+                start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        """Return whatever is left once the text is complete"""
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return [rest] if rest else []
+
+
+class SpeechPipeline:
+    """Synthesize an answer sentence by sentence while it is still streaming.
+
+    ``feed`` takes text as it arrives; each completed sentence is handed to
+    ``synthesize`` (sentence -> iterable of audio chunks) on a background
+    thread, so the next sentence is synthesized while the caller plays the
+    previous one. ``chunks`` yields the audio in order and re-raises any
+    error from synthesis or from ``close(error)``.
+    """
+
+    def __init__(self, synthesize, min_chars=MIN_SENTENCE_CHARS):
+        self._synthesize = synthesize
+        self._splitter = SentenceSplitter(min_chars)
+        self._sentences = queue.Queue()
+        self._audio = queue.Queue()
+        self._cancelled = threading.Event()
+        self.sentences = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def feed(self, text):
+        for sentence in self._splitter.feed(text):
+            self._sentences.put(sentence)
+
+    def close(self, error=None):
+        """No more text is coming; pass an exception to fail the audio stream"""
+        if error is None:
+            for sentence in self._splitter.flush():
+                self._sentences.put(sentence)
+        self._sentences.put(error if error is not None else _END)
+
+    def cancel(self):
+        """Drop the answer: stop after the current sentence and discard its audio"""
+        self._cancelled.set()
+        self._sentences.put(_END)
+
+    def _run(self):
+        try:
+            while not self._cancelled.is_set():
+                sentence = self._sentences.get()
+                if sentence is _END:
+                    break
+                if isinstance(sentence, BaseException):
+                    raise sentence
+                self.sentences += 1
+                for chunk in self._synthesize(sentence):
+                    if self._cancelled.is_set():
+                        break
+                    if chunk:
+                        self._audio.put(chunk)
+        except Exception as e:
+            self._audio.put(e)
+        finally:
+            self._audio.put(_END)
+
+    def chunks(self):
+        while True:
+            item = self._audio.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
@@ -0,0 +1,81 @@
+import json
+
+from quiz_parser import IncrementalJSONArrayParser, parse_quiz_questions
+
+QUESTIONS = [
+    {"question": "What do plants make in photosynthesis?", "options": ["Glucose", "Salt", "Iron", "Sand"],
+     "answer": "A", "explanation": "Plants turn light into glucose [sugar]."},
+    {"question": "Which gas do plants take in?", "options": ["Oxygen", "Carbon dioxide", "Helium", "Neon"],
+     "answer": "B", "explanation": "They absorb \"CO2\" from the air."},
+]
+ARRAY = json.dumps(QUESTIONS, indent=2)
+
+
+def feed_in_chunks(parser, text, size):
+    completed = []
+    for start in range(0, len(text), size):
+        completed += parser.feed(text[start:start + size])
+    return completed
+
+
+def test_whole_array_in_one_chunk():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed(ARRAY) == QUESTIONS
+    assert parser.done
+
+
+def test_objects_complete_while_streaming():
+    first_end = ARRAY.index("},") + 1
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed(ARRAY[:first_end - 1]) == []
+    assert parser.feed(ARRAY[first_end - 1:first_end + 10]) == QUESTIONS[:1]
+    assert parser.feed(ARRAY[first_end + 10:]) == QUESTIONS[1:]
+
+
+def test_one_character_at_a_time():
+    parser = IncrementalJSONArrayParser()
+    assert feed_in_chunks(parser, ARRAY, 1) == QUESTIONS
+
+
+def test_brackets_in_leading_prose_are_skipped():
+    text = f"Here is [your] quiz: {ARRAY}"
+    for size in (1, 7, len(text)):
+        assert feed_in_chunks(IncrementalJSONArrayParser(), text, size) == QUESTIONS
+
+
+def test_array_of_non_objects_before_the_quiz_is_skipped():
+    text = f"Pick [1, 2] of these: {ARRAY}"
+    assert IncrementalJSONArrayParser().feed(text) == QUESTIONS
+
+
+def test_code_fence_is_skipped():
+    assert IncrementalJSONArrayParser().feed(f"```json\n{ARRAY}\n```") == QUESTIONS
+
+
+def test_malformed_element_is_counted_and_skipped():
+    text = '[{"question": "Broken", "answer": A}, ' + json.dumps(QUESTIONS[0]) + "]"
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed(text) == QUESTIONS[:1]
+    assert parser.errors == 1
+
+
+def test_text_after_the_array_is_ignored():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed(ARRAY + ' and [{"question": "extra"}]') == QUESTIONS
+    assert parser.done
+    assert parser.feed('{"question": "more"}') == []
+
+
+def test_parse_quiz_questions_with_brackets_in_prose():
+    assert parse_quiz_questions(f"Here is [your] quiz: {ARRAY} Enjoy [it]!") == (QUESTIONS, True)
+
+
+def test_parse_quiz_questions_salvages_valid_objects():
+    text = "[" + json.dumps(QUESTIONS[0]) + ', {"question": oops}]'
+    assert parse_quiz_questions(text) == (QUESTIONS[:1], True)
+
+
+def test_parse_quiz_questions_without_an_array():
+    questions, parsed_ok = parse_quiz_questions("Sorry, I cannot write a quiz about [that].")
+    assert not parsed_ok
+    assert questions[0]["question"] == "Quiz parsing error"
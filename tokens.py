@@ -0,0 +1,152 @@
+import threading
+from collections import defaultdict
+
+# tiktoken is optional; without it (or offline) we fall back to an estimate
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Context window per model, in tokens
+MODEL_CONTEXT_WINDOWS = {
+    "llama3-70b-8192": 8192,
+    "mixtral-8x7b-32768": 32768,
+    "llama-3.3-70b-versatile": 131072,
+    "gpt-4o-mini": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Tokens kept free for the completion, per endpoint
+COMPLETION_RESERVE = {
+    "chat": 1024,
+    "quiz": 4096,
+}
+DEFAULT_COMPLETION_RESERVE = 1024
+
+# Per-message overhead for role markers in chat formats
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+_encoding_failed = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed and tiktoken is not None:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    # cl100k is exact for OpenAI and close enough for Llama/Mixtral
+                    _encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception:
+                    # The BPE file could not be loaded (e.g. no network), estimate instead
+                    _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text):
+    """Count tokens in a string, exact with tiktoken, otherwise ~4 chars per token"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def count_message_tokens(messages, system_prompt=""):
+    """Count tokens for a system prompt plus a list of str or {"role", "content"} messages"""
+    total = count_tokens(system_prompt) + (MESSAGE_OVERHEAD_TOKENS if system_prompt else 0)
+    for message in messages:
+        content = message["content"] if isinstance(message, dict) else message
+        total += count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+    return total
+
+
+def prompt_token_limit(model_name, endpoint):
+    """Largest prompt a model accepts on an endpoint, leaving room for the answer"""
+    window = MODEL_CONTEXT_WINDOWS.get(model_name, DEFAULT_CONTEXT_WINDOW)
+    return window - COMPLETION_RESERVE.get(endpoint, DEFAULT_COMPLETION_RESERVE)
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text down to at most max_tokens tokens"""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is not None:
+        ids = encoding.encode(text, disallowed_special=())
+        return text if len(ids) <= max_tokens else encoding.decode(ids[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+class PromptTooLargeError(ValueError):
+    """Raised before any network call when a prompt cannot fit the model"""
+
+    def __init__(self, model_name, prompt_tokens, limit):
+        self.model_name = model_name
+        self.prompt_tokens = prompt_tokens
+        self.limit = limit
+        super().__init__(
+            f"Request is too long for {model_name}: {prompt_tokens} prompt tokens, limit is {limit}"
+        )
+
+
+class TokenLedger:
+    """Running prompt/completion token totals per (endpoint, provider, model)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = defaultdict(lambda: {
+            "requests": 0,
+            "prompt_tokens": 0,
+            # Prompt tokens the provider served from its prompt-prefix cache
+            "cached_prompt_tokens": 0,
+            "completion_tokens": 0,
+            "estimated_requests": 0,
+            "rejected": 0,
+            "truncated": 0,
+        })
+
+    def record(self, endpoint, provider, model_name, prompt_tokens, completion_tokens, estimated=False, cached_prompt_tokens=0):
+        with self._lock:
+            totals = self._totals[(endpoint, provider, model_name)]
+            totals["requests"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["cached_prompt_tokens"] += cached_prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            if estimated:
+                totals["estimated_requests"] += 1
+
+    def record_rejected(self, endpoint, provider, model_name):
+        with self._lock:
+            self._totals[(endpoint, provider, model_name)]["rejected"] += 1
+
+    def record_truncated(self, endpoint, provider, model_name):
+        with self._lock:
+            self._totals[(endpoint, provider, model_name)]["truncated"] += 1
+
+    def stats(self):
+        with self._lock:
+            rows = [
+                dict(totals, endpoint=endpoint, provider=provider, model=model_name)
+                for (endpoint, provider, model_name), totals in self._totals.items()
+            ]
+        for row in rows:
+            row["prompt_cache_hit_rate"] = _hit_rate(row)
+        overall = {
+            "requests": sum(r["requests"] for r in rows),
+            "prompt_tokens": sum(r["prompt_tokens"] for r in rows),
+            "cached_prompt_tokens": sum(r["cached_prompt_tokens"] for r in rows),
+            "completion_tokens": sum(r["completion_tokens"] for r in rows),
+        }
+        overall["prompt_cache_hit_rate"] = _hit_rate(overall)
+        return {"total": overall, "by_model": rows}
+
+
+def _hit_rate(totals):
+    return totals["cached_prompt_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0
+
+
+token_ledger = TokenLedger()
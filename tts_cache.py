@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+# Synthesized speech is kept here and replayed for identical requests
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def tts_cache_key(text, voice_id, model_id, output_format, prefix=""):
+    """Hash of everything that changes the synthesized audio"""
+    payload = json.dumps([text, voice_id, model_id, output_format, prefix], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """Content-addressed audio files on disk with a byte quota.
+
+    Each file is named by the hash of its request, so the frontend and the
+    voice agent share entries. A hit refreshes the file's mtime and evictions
+    remove the least recently used files first. Files are written to a
+    temporary name and renamed, so concurrent processes never see partial
+    audio.
+    """
+
+    def __init__(self, directory=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, key, output_format):
+        # "mp3_22050_32" -> .mp3, "pcm_16000" -> .pcm
+        return os.path.join(self.directory, f"{key}.{output_format.split('_')[0]}")
+
+    def get(self, key, output_format):
+        """Path of the cached audio, or None on a miss"""
+        path = self.path(key, output_format)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def _write(self, key, output_format, chunks):
+        # Passes the chunks through; the entry only appears once all of them were written
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key, output_format)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    if chunk:
+                        f.write(chunk)
+                        yield chunk
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self._evict(keep=path)
+
+    def put(self, key, output_format, chunks):
+        """Write streamed audio chunks to the cache, returns the file path"""
+        for _ in self._write(key, output_format, chunks):
+            pass
+        return self.path(key, output_format)
+
+    def stream(self, synthesize, text, voice_id, model_id, output_format, prefix=""):
+        """Yield audio chunks as they are synthesized, saving them; read from disk on a hit"""
+        key = tts_cache_key(text, voice_id, model_id, output_format, prefix)
+        path = self.get(key, output_format)
+        if path is not None:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                data = None  # Evicted by another process since the lookup
+            if data is not None:
+                yield data
+                return
+        yield from self._write(key, output_format, synthesize())
+
+    def get_or_synthesize(self, synthesize, text, voice_id, model_id, output_format, prefix=""):
+        """Return (path, cached); ``synthesize`` is only called on a miss and yields audio chunks"""
+        key = tts_cache_key(text, voice_id, model_id, output_format, prefix)
+        path = self.get(key, output_format)
+        if path is not None:
+            return path, True
+        return self.put(key, output_format, synthesize()), False
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".part"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # Evicted by another process meanwhile
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self, keep):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def stats(self):
+        entries = self._entries() if os.path.isdir(self.directory) else []
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+tts_cache = TTSCache()
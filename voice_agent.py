@@ -1,20 +1,31 @@
 import os
+import json
 import platform
 import subprocess
+import tempfile
+import threading
 import requests
 import speech_recognition as sr
 from pydub import AudioSegment
 from io import BytesIO
 from elevenlabs import save
 from elevenlabs.client import ElevenLabs
+from tts_cache import tts_cache
+from speech_stream import SpeechPipeline
 
 # ========== SETUP ==========
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")  # Or hardcode for testing
 API_URL = "http://127.0.0.1:9999/chat"  # Your FastAPI backend
+STREAM_API_URL = "http://127.0.0.1:9999/chat/stream"
 MODEL_NAME = "llama-3.3-70b-versatile"
 PROVIDER = "Groq"
 SYSTEM_PROMPT = "Act as a smart and friendly AI"
 ALLOW_SEARCH = False
+LANGUAGE = "en-US"
+# Speak each sentence as soon as it is written instead of after the whole answer
+VOICE_STREAMING = os.getenv("VOICE_STREAMING", "true").lower() in ("1", "true", "yes")
+TTS_MODEL_ID = "eleven_turbo_v2"
+TTS_OUTPUT_FORMAT = "mp3_22050_32"
 
 # Predefined voice IDs (you can add more as needed)
 VOICE_IDS = {
@@ -26,6 +37,25 @@ VOICE_IDS = {
     "Aria": "EXAVITQu4vr4xnSDxMaL"  # Default voice
 }
 
+_elevenlabs_client = None
+
+
+def elevenlabs_client():
+    """One ElevenLabs client, and so one connection pool, for every synthesis"""
+    global _elevenlabs_client
+    if _elevenlabs_client is None:
+        _elevenlabs_client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
+    return _elevenlabs_client
+
+
+def save_answer_audio(audio):
+    """Write the whole answer's audio to a temporary MP3 file, returns its path"""
+    with tempfile.NamedTemporaryFile(prefix="response_", suffix=".mp3", delete=False) as f:
+        for chunk in audio:
+            f.write(chunk)
+    return f.name
+
+
 # ========== SPEECH TO TEXT ==========
 def record_and_transcribe():
     recognizer = sr.Recognizer()
@@ -56,7 +86,8 @@ def ask_ai_agent(user_text):
         "model_provider": PROVIDER,
         "system_prompt": SYSTEM_PROMPT,
         "messages": [user_text],
-        "allow_search": ALLOW_SEARCH
+        "allow_search": ALLOW_SEARCH,
+        "language": LANGUAGE
     }
     try:
         response = requests.post(API_URL, json=payload)
@@ -73,48 +104,161 @@ def ask_ai_agent(user_text):
 
 
 # ========== TEXT TO SPEECH ==========
-def speak_with_elevenlabs(text, voice_name="Aria", output_path="response.mp3"):
+def speak_with_elevenlabs(text, voice_name="Aria"):
     try:
-        client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
-        
         # Get voice ID from name
         voice_id = VOICE_IDS.get(voice_name, VOICE_IDS["Aria"])
         
-        # Generate audio with the new SDK syntax
-        audio = client.text_to_speech.convert(
-            voice_id=voice_id,
-            model_id="eleven_turbo_v2",
-            text=text,
-            output_format="mp3_22050_32"
-        )
+        client = elevenlabs_client()
+
+        def synthesize():
+            # Generate audio with the new SDK syntax
+            return client.text_to_speech.convert(
+                voice_id=voice_id,
+                model_id=TTS_MODEL_ID,
+                text=text,
+                output_format=TTS_OUTPUT_FORMAT
+            )
         
-        # Save audio chunks to file
-        with open(output_path, "wb") as f:
-            for chunk in audio:
-                if chunk:
-                    f.write(chunk)
-
-        # Play audio
-        os_name = platform.system()
-        if os_name == "Windows":
-            subprocess.run(['powershell', '-c', f'(New-Object Media.SoundPlayer "{output_path}").PlaySync();'])
-        elif os_name == "Darwin":
-            subprocess.run(['afplay', output_path])
-        elif os_name == "Linux":
-            subprocess.run(['mpg123', output_path])
-        else:
-            print("⚠️ Unknown OS, cannot auto-play.")
-            
+        # Shared with the Streamlit frontend; repeated answers play without calling ElevenLabs
+        output_path, _ = tts_cache.get_or_synthesize(synthesize, text, voice_id, TTS_MODEL_ID, TTS_OUTPUT_FORMAT)
+        play_audio_file(output_path)
         return output_path
     except Exception as e:
         print(f"❌ Error in TTS: {e}")
         return None
 
 
+def play_audio_file(output_path):
+    os_name = platform.system()
+    if os_name == "Windows":
+        subprocess.run(['powershell', '-c', f'(New-Object Media.SoundPlayer "{output_path}").PlaySync();'])
+    elif os_name == "Darwin":
+        subprocess.run(['afplay', output_path])
+    elif os_name == "Linux":
+        subprocess.run(['mpg123', output_path])
+    else:
+        print("⚠️ Unknown OS, cannot auto-play.")
+
+
+# ========== STREAMED ANSWER AND SPEECH ==========
+def iter_sse(response):
+    """Yield (event, data) pairs from a server-sent events response"""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+        elif not line and data_lines:
+            yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+
+
+def open_player():
+    """mpg123 reading MP3 from stdin, or None if it is not installed"""
+    try:
+        return subprocess.Popen(['mpg123', '-q', '-'], stdin=subprocess.PIPE)
+    except OSError:
+        return None
+
+
+def ask_and_speak(user_text, voice_name="Aria"):
+    """Stream the answer from the backend and speak it sentence by sentence.
+
+    Each sentence is synthesized while the previous one plays and its audio
+    is piped straight into mpg123, so speech starts after the first sentence.
+    Without mpg123 the audio is played from a temporary file once complete.
+    Returns (answer, audio path).
+    """
+    voice_id = VOICE_IDS.get(voice_name, VOICE_IDS["Aria"])
+    client = elevenlabs_client()
+
+    def synthesize_sentence(sentence):
+        def synthesize():
+            return client.text_to_speech.convert(
+                voice_id=voice_id,
+                model_id=TTS_MODEL_ID,
+                text=sentence,
+                output_format=TTS_OUTPUT_FORMAT
+            )
+        return tts_cache.stream(synthesize, sentence, voice_id, TTS_MODEL_ID, TTS_OUTPUT_FORMAT)
+
+    speech = SpeechPipeline(synthesize_sentence)
+    answer = {"text": ""}
+    payload = {
+        "model_name": MODEL_NAME,
+        "model_provider": PROVIDER,
+        "system_prompt": SYSTEM_PROMPT,
+        "messages": [user_text],
+        "allow_search": ALLOW_SEARCH,
+        "language": LANGUAGE
+    }
+
+    def read_answer():
+        # Runs beside playback: writing to mpg123 blocks at the speed it plays
+        try:
+            with requests.post(STREAM_API_URL, json=payload, stream=True) as response:
+                response.raise_for_status()
+                print("🤖 Bot says: ", end="", flush=True)
+                for event, data in iter_sse(response):
+                    if event == "token":
+                        print(data["content"], end="", flush=True)
+                        speech.feed(data["content"])
+                    elif event == "done":
+                        answer["text"] = data["response"]
+                    elif event == "error":
+                        raise RuntimeError(data["error"])
+                print()
+        except Exception as e:
+            speech.close(e)
+        else:
+            speech.close()
+
+    threading.Thread(target=read_answer, daemon=True).start()
+
+    audio = []
+    player = open_player()
+    playing = player is not None
+    try:
+        for chunk in speech.chunks():
+            audio.append(chunk)
+            if playing:
+                try:
+                    player.stdin.write(chunk)
+                    player.stdin.flush()
+                except BrokenPipeError:
+                    print("⚠️ Audio player exited early.")
+                    playing = False
+    except Exception as e:
+        print(f"\n❌ Error in voice response: {e}")
+        return answer["text"], None
+    finally:
+        if player is not None:
+            try:
+                player.stdin.close()
+            except BrokenPipeError:
+                pass
+            player.wait()
+
+    if not answer["text"] or not audio:
+        return answer["text"], None
+    # The sentences are cached already, the joined audio goes to a temporary file
+    output_path = save_answer_audio(audio)
+    if player is None:
+        play_audio_file(output_path)
+    return answer["text"], output_path
+
+
 # ========== MAIN WORKFLOW ==========
 def main():
     user_input = record_and_transcribe()
-    if user_input:
+    if user_input and VOICE_STREAMING:
+        # Use Rachel as the default voice
+        bot_response, audio_file = ask_and_speak(user_input, voice_name="Rachel")
+        if audio_file:
+            print(f"🔊 Audio response saved to: {audio_file}")
+    elif user_input:
         bot_response = ask_ai_agent(user_input)
         if bot_response:
             print(f"🤖 Bot says: {bot_response}")